@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+import numpy as np
+
+from audio_processing import analysis_decimation, frame_rms
+from decoders import get_decoder, time_window
+
+def _to_mono(block):
+    """Downmix a (samples, channels) block to mono"""
+    if block.shape[1] == 1:
+        return block[:, 0]
+    return np.mean(block, axis=1, dtype=block.dtype)
+
+def scan_peak(path, blocksize, on_block=None, decoder=None, start=0, stop=None,
+              decimate=1):
+    """
+    Peak absolute value of the mono downmix of samples [start, stop) of a
+    file, read block by block and decimated by decimate.
+    on_block: called with the number of file samples in each block read
+    """
+    decoder = get_decoder(decoder)
+    peak = 0.0
+    for block in decoder.blocks(path, blocksize, start, stop, decimate):
+        peak = max(peak, float(np.max(np.abs(_to_mono(block)), initial=0.0)))
+        if on_block is not None:
+            on_block(len(block) * decimate)
+    return peak
+
+def stream_track_rms(path, min_len, frame_len, blocksize, on_block=None,
+                     decoder=None, start=0, stop=None, decimate=1):
+    """
+    Per-frame RMS energies of min_len samples of one recording from sample
+    start on, downmixed to float32 mono and normalized by the peak of
+    [start, stop), read block by block.
+    decimate: analyse at sample_rate / decimate. frame_len is in decimated
+              samples (a Fraction if decimate doesn't divide the frame), and
+              blocksize must be a multiple of decimate that holds whole frames.
+    on_block: called with the number of file samples in each block read
+    """
+    decoder = get_decoder(decoder)
+    # Normalization needs the global peak, so scan for it first
+    peak = scan_peak(path, blocksize, on_block, decoder, start, stop, decimate)
+    gain = np.float32(1 / peak) if peak else np.float32(1)
+
+    energy = []
+    for block in decoder.blocks(path, blocksize, start, start + min_len, decimate):
+        mono = _to_mono(block) * gain
+        energy.append(frame_rms(mono, len(mono), frame_len))
+        if on_block is not None:
+            on_block(len(mono) * decimate)
+    return np.concatenate(energy) if energy else np.zeros(0)
+
+def stream_frame_rms(paths, frame_ms, block_frames=2000, progress=None,
+                     workers=1, decoder=None, start_time=None, end_time=None,
+                     analysis_rate=None):
+    """
+    Per-frame RMS energies of each speaker's recording without loading them whole.
+    Every file is downmixed to float32 mono and peak normalized the same
+    way process_audio does it, and cut to the length of the shortest one.
+    Peak memory depends on block_frames, not on how long the recordings are.
+    progress: called after every block with the fraction of samples read.
+              It may raise to abort.
+    workers: number of files streamed at the same time
+    decoder: decoder backend or its name (default: soundfile)
+    start_time, end_time: only analyse this window, in seconds
+    analysis_rate: if set, decimate to about this rate before the energies
+    Returns: (tuple of energy arrays, sample_rate)
+    """
+    decoder = get_decoder(decoder)
+    infos = [decoder.info(path) for path in paths]
+    sample_rates = {info.sample_rate for info in infos}
+    assert len(sample_rates) == 1
+    sample_rate = sample_rates.pop()
+
+    frame_len = int(sample_rate * frame_ms / 1000)
+    decimate = 1
+    if analysis_rate:
+        decimate = analysis_decimation(sample_rate, analysis_rate)
+        # Blocks of a multiple of decimate frames are whole decimated samples,
+        # and start on a frame boundary
+        block_frames = -(-block_frames // decimate) * decimate
+    blocksize = frame_len * block_frames
+    windows = [time_window(info, start_time, end_time) for info in infos]
+    min_len = min(stop - start for start, stop in windows)
+
+    total = sum(stop - start for start, stop in windows) + len(infos) * min_len
+    done = 0
+    lock = threading.Lock()
+    def on_block(samples):
+        nonlocal done
+        with lock:
+            done += samples
+            fraction = done / max(total, 1)
+        if progress is not None:
+            progress(fraction)
+
+    def track_rms(path, window):
+        return stream_track_rms(path, min_len, Fraction(frame_len, decimate), blocksize,
+                                on_block, decoder, *window, decimate)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            energies = tuple(pool.map(track_rms, paths, windows))
+    else:
+        energies = tuple(map(track_rms, paths, windows))
+    # Decoders that estimate the length from the duration can come up short
+    n = min(len(energy) for energy in energies)
+    return tuple(energy[:n] for energy in energies), sample_rate
+
+def file_blocks(paths, blocksize, decoder=None):
+    """
+    Read several recordings in lockstep, block by block, until the shortest ends.
+    Yields: (samples, speakers) float32 blocks, one mono column per file
+    """
+    decoder = get_decoder(decoder)
+    streams = [decoder.blocks(path, blocksize) for path in paths]
+    for blocks in zip(*streams):
+        n = min(len(block) for block in blocks)
+        yield np.column_stack([_to_mono(block[:n]) for block in blocks])
+
+def pcm_blocks(stream, channels, blocksize, dtype="int16"):
+    """
+    Read interleaved raw PCM from a binary stream (e.g. stdin), one channel per speaker.
+    Yields: (samples, speakers) float32 blocks scaled to [-1, 1]
+    """
+    dtype = np.dtype(dtype)
+    frame_bytes = dtype.itemsize * channels
+    scale = 1 / 2**(8*dtype.itemsize - 1) if dtype.kind == "i" else 1
+    leftover = b""
+    while True:
+        data = stream.read(blocksize * frame_bytes)
+        if not data:
+            break
+        # Pipes can return partial reads, keep any split sample for next time
+        data = leftover + data
+        usable = len(data) - len(data) % frame_bytes
+        leftover = data[usable:]
+        if usable:
+            block = np.frombuffer(data[:usable], dtype=dtype)
+            yield block.reshape(-1, channels).astype(np.float32) * np.float32(scale)
@@ -1,90 +1,257 @@
+import itertools
+import math
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+
 import numpy as np
 
 FRAME_MS = 30
+PROGRESS_STEPS = 2000  # DP steps between progress callbacks
 
 class Cam:
-    WIDE = 3
+    WIDE = 0
     C1 = 1
     C2 = 2
 
+    @staticmethod
+    def closeup(speaker):
+        """Close-up camera of a speaker, counting speakers from 0"""
+        return speaker + 1
+
+    @staticmethod
+    def all(n_speakers):
+        """Wide shot first, then one close-up per speaker"""
+        return [Cam.WIDE] + [Cam.closeup(k) for k in range(n_speakers)]
+
+    @staticmethod
+    def name(cam):
+        return "Wide" if cam == Cam.WIDE else f"Close-up {cam}"
+
+class Runs:
+    """
+    Run-length encoded sequence. Run k is values[k] repeated lengths[k]
+    times from frame starts[k]. values may have extra dimensions, e.g.
+    (runs, 2) for (s1, s2) activity pairs.
+    """
+    def __init__(self, starts, lengths, values):
+        self.starts = np.asarray(starts)
+        self.lengths = np.asarray(lengths)
+        self.values = np.asarray(values)
+
+    @classmethod
+    def encode(cls, seq):
+        seq = np.asarray(seq)
+        change = seq[1:] != seq[:-1]
+        if change.ndim > 1:
+            change = change.any(axis=tuple(range(1, change.ndim)))
+        starts = np.flatnonzero(change) + 1
+        if len(seq):
+            starts = np.concatenate(([0], starts))
+        lengths = np.diff(np.append(starts, len(seq)))
+        return cls(starts, lengths, seq[starts])
+
+    def __len__(self):
+        """Number of frames (not runs)"""
+        return int(self.starts[-1] + self.lengths[-1]) if len(self.starts) else 0
+
+    def decode(self):
+        return np.repeat(self.values, self.lengths, axis=0)
+
+    def __iter__(self):
+        """Frame by frame values, decoded lazily"""
+        for value, length in zip(self.values.tolist(), self.lengths.tolist()):
+            yield from itertools.repeat(value, length)
+
+    def every(self, stride):
+        """Values at frames 0, stride, 2*stride, ..."""
+        index = np.arange(0, len(self), stride)
+        return self.values[np.searchsorted(self.starts, index, side="right") - 1]
+
 # === SIMPLE AUDIO PROCESSING ===
 def normalize_audio(audio):
     max_val = np.max(np.abs(audio))
     if max_val == 0:
         return audio
     return audio / max_val
-    
+
+def audio_peak(audio, chunk_len=2**22, on_block=None):
+    """
+    np.max(np.abs(audio)), read chunk by chunk so np.memmap tracks aren't loaded whole
+    on_block: called with the number of samples in each chunk read. It may raise to abort.
+    """
+    peak = 0
+    for start in range(0, len(audio), chunk_len):
+        chunk = audio[start:start + chunk_len]
+        if chunk.dtype.kind in "iu":
+            # abs(-32768) doesn't fit in int16
+            chunk = chunk.astype(np.float32)
+        peak = max(peak, np.max(np.abs(chunk)))
+        if on_block is not None:
+            on_block(len(chunk))
+    return peak
+
+def chunked_frame_rms(audio, min_len, frame_len, peak=None, chunk_frames=8192,
+                      on_block=None):
+    """
+    frame_rms() of audio read in frame-aligned chunks, each divided by peak
+    first (normalize_audio() with peak = audio_peak()). Same result, but
+    only one chunk at a time is in memory, e.g. of an np.memmap track.
+    Integer samples are converted to float32.
+    on_block: called with the number of samples in each chunk read. It may raise to abort.
+    """
+    frame_len = Fraction(frame_len)
+    # Chunks start on whole samples where frame_rms() rounds fractional frames the same way
+    chunk_frames = -(-chunk_frames // frame_len.denominator) * frame_len.denominator
+    step = int(chunk_frames * frame_len)
+    energies = []
+    for start in range(0, min_len, step):
+        # Not cut at min_len: the last frame reads on up to frame_len, as in frame_rms()
+        chunk = audio[start:start + step]
+        if chunk.dtype.kind in "iu":
+            chunk = chunk.astype(np.float32)
+        if peak:
+            chunk = chunk / peak
+        n = min(step, min_len - start)
+        energies.append(frame_rms(chunk, n, frame_len))
+        if on_block is not None:
+            on_block(n)
+    return np.concatenate(energies) if energies else np.zeros(0)
+
 # === VOICE DETECTION AND PROCESSING ===
-def voice_detect(speaker1_audio, speaker2_audio, min_len, frame_len,
-                 threshold, dominance):
-    def rms(frame):
-        return np.sqrt(np.mean(np.square(frame)) + 1e-9)
+def frame_rms(audio, min_len, frame_len):
+    """
+    RMS energy of each frame_len chunk of audio[:min_len].
+    The last frame may be partial, and like any frame it reads up to
+    frame_len samples from audio even past min_len.
+    frame_len may be a Fraction, for audio decimated by a factor that doesn't
+    divide the frame length. Frame i then covers the samples from
+    round(i * frame_len) up to round((i+1) * frame_len).
+    """
+    frame_len = Fraction(frame_len)
+    if frame_len.denominator != 1:
+        return _fractional_frame_rms(audio, min_len, frame_len)
+    frame_len = int(frame_len)
+    n_full = min_len // frame_len
+    frames = audio[:n_full * frame_len].reshape(n_full, frame_len)
+    energy = np.einsum("ij,ij->i", frames, frames) / frame_len
+    if n_full * frame_len < min_len:
+        tail = audio[n_full * frame_len:(n_full + 1) * frame_len]
+        energy = np.append(energy, np.mean(np.square(tail)))
+    return np.sqrt(energy + 1e-9)
 
-    speaker1_active = []
-    speaker2_active = []
-    for i in range(0, min_len, frame_len):
-        f1 = speaker1_audio[i:i + frame_len]
-        f2 = speaker2_audio[i:i + frame_len]
+def _fractional_frame_rms(audio, min_len, frame_len):
+    n = math.ceil(min_len / frame_len)
+    p, q = frame_len.numerator, frame_len.denominator
+    # Rounded (half up) frame boundaries, in integers
+    bounds = (2 * np.arange(n + 1, dtype=np.int64) * p + q) // (2 * q)
+    bounds[-1] = min(bounds[-1], len(audio))
+    if n == 0:
+        return np.sqrt(np.zeros(0) + 1e-9)
+    squares = np.square(audio[:bounds[-1]])
+    energy = np.add.reduceat(squares, bounds[:-1]) / np.diff(bounds)
+    return np.sqrt(energy + 1e-9)
 
-        e1, e2 = rms(f1), rms(f2)
+def activity_from_energy(energies, threshold, dominance):
+    """
+    Threshold and bleed-filter per-speaker frame energies into int8 activity masks.
+    A frame is loud if any speaker is above threshold. If one speaker is
+    `dominance` times louder than every other one, only they are active
+    (the first such speaker wins). Otherwise every speaker that no one
+    else dominates is active.
+    """
+    energies = np.asarray(energies)
+    n_speakers = len(energies)
+    loud = np.any(energies > threshold, axis=0)
 
-        s1 = s2 = 0
-        if e1 > threshold or e2 > threshold:
-            if e1 > e2 * dominance:
-                s1 = 1
-            elif e2 > e1 * dominance:
-                s2 = 1
-            else:
-                s1 = s2 = 1
+    # dominates[j, k]: speaker j is `dominance` times louder than speaker k
+    dominates = energies[:, None, :] > energies[None, :, :] * dominance
+    dominates[np.arange(n_speakers), np.arange(n_speakers)] = False
+    dominated = np.any(dominates, axis=0)
 
-        speaker1_active.append(s1)
-        speaker2_active.append(s2)
+    sole = np.all(dominates | np.eye(n_speakers, dtype=bool)[:, :, None], axis=1)
+    first_sole = np.cumsum(sole, axis=0) == 1
+    sole &= first_sole
+    any_sole = np.any(sole, axis=0)
 
-    return speaker1_active, speaker2_active
+    active = loud & np.where(any_sole, sole, ~dominated)
+    return tuple(active.astype(np.int8))
+
+def analysis_decimation(sample_rate, analysis_rate):
+    """
+    Largest decimation factor that keeps the rate at or above analysis_rate.
+    It divides sample_rate, so the decimated rate is a whole number of Hz.
+    It needn't divide the frame length, see frame_rms().
+    """
+    return max(k for k in range(1, max(1, int(sample_rate // analysis_rate)) + 1)
+               if sample_rate % k == 0)
+
+def compare_activity(reference, test):
+    """
+    Agreement of two sets of per-speaker activity masks, e.g. full-rate and
+    low-rate analysis of the same audio.
+    Returns: one dict per speaker with the frames compared, the fraction that
+             agree, and the frames active only in reference (missed) or only
+             in test (extra)
+    """
+    report = []
+    for ref, other in zip(reference, test):
+        n = min(len(ref), len(other))
+        ref = np.asarray(ref[:n]) != 0
+        other = np.asarray(other[:n]) != 0
+        report.append({"frames": n,
+                       "agreement": float(np.mean(ref == other)) if n else 1.0,
+                       "missed": int(np.count_nonzero(ref & ~other)),
+                       "extra": int(np.count_nonzero(~ref & other))})
+    return report
+
+def voice_detect(speaker_audio, min_len, frame_len, threshold, dominance):
+    """speaker_audio: one mono signal per speaker, arrays or np.memmap tracks"""
+    energies = [chunked_frame_rms(audio, min_len, frame_len) for audio in speaker_audio]
+    return activity_from_energy(energies, threshold, dominance)
 
 def lookahead_smoothing(activity, lookahead_time):
+    """
+    Fill silent gaps shorter than lookahead_time between two active frames.
+    A gap at the very start counts as following the last frame, so it is
+    filled when the recording ends active. A gap at the end is never filled.
+    """
     lookahead_time = int(lookahead_time * 1000 / FRAME_MS)
-    smoothed = activity.copy()
-    length = len(activity)
-
-    for i in range(length):
-        if activity[i] == 0 and smoothed[i-1] != 0:
-            # Look ahead to see if it's really the end
-            end = min(i + lookahead_time, length)
-            if np.any(activity[i+1:end]):
-                smoothed[i] = 1  # Treat as part of ongoing speech
+    smoothed = np.array(activity)
+    length = len(smoothed)
+    active = smoothed != 0
+    index = np.arange(length)
+
+    # Nearest active frame at or after / before each frame
+    next_active = np.where(active, index, length)
+    next_active = np.minimum.accumulate(next_active[::-1])[::-1]
+    prev_active = np.maximum.accumulate(np.where(active, index, -1))
+
+    gap_len = next_active - (prev_active + 1)
+    fill = ~active & (next_active < length) & (gap_len < lookahead_time)
+    if length and not active[-1]:
+        fill &= prev_active >= 0
+    smoothed[fill] = 1
     return smoothed
 
 def label_injections(speaker_activity, min_talk_time_sec):
+    """Label talking bursts shorter than min_talk_time_sec as 0.5"""
     min_talk_frames = int(min_talk_time_sec * 1000 / FRAME_MS)
-    labeled = speaker_activity.copy()
-    length = len(speaker_activity)
-
-    i = 0
-    while i < length:
-        if speaker_activity[i] == 1:
-            start = i
-            while i < length and speaker_activity[i] == 1:
-                i += 1
-            end = i
-            burst_length = end - start
-            if burst_length < min_talk_frames:
-                for j in range(start, end):
-                    labeled[j] = 0.5
-        else:
-            i += 1
-
-    return labeled
+    runs = Runs.encode(np.asarray(speaker_activity, dtype=float))
+    runs.values[(runs.values == 1) & (runs.lengths < min_talk_frames)] = 0.5
+    return runs.decode()
 
 # === CUT LABELING ===
-def score_frame(cam, s1, s2, closeup_reward, wide_reward, miss_penalty):
-    """Per-frame reward/penalty for a chosen camera."""
-    if cam == Cam.C1:
-        return (closeup_reward if s1 else 0) + (-miss_penalty if s2 else 0)
-    elif cam == Cam.C2:
-        return (closeup_reward if s2 else 0) + (-miss_penalty if s1 else 0)
-    elif cam == Cam.WIDE:
-        return wide_reward if (s1 or s2) else 0
+def score_frame(cam, active, closeup_reward, wide_reward, miss_penalty):
+    """
+    Per-frame reward/penalty for a chosen camera.
+    active: activity of every speaker
+    """
+    if cam == Cam.WIDE:
+        return wide_reward if any(active) else 0
+    speaker = cam - Cam.closeup(0)
+    missed = sum(1 for k, a in enumerate(active) if a and k != speaker)
+    return (closeup_reward if active[speaker] else 0) - miss_penalty * missed
 
 def cut_penalty(frames_since_last_cut, cut_splits, cut_penalties):
     """Nonlinear cut penalty"""
@@ -93,96 +260,545 @@ def cut_penalty(frames_since_last_cut, cut_splits, cut_penalties):
             return penalty
     return cut_penalties[-1]
 
+def cut_penalty_table(max_l, cut_splits, cut_penalties):
+    """
+    cut_penalty() for every "frames since last cut" value up to max_l, without
+    the tail that only repeats the last penalty. From there on every l value
+    gets the same penalty for any future cut, so the DP can merge them into
+    its last (saturating) l state without changing the optimum. With the
+    default splits that is 36 states per camera instead of max_l+1.
+    """
+    table = np.array([cut_penalty(l, cut_splits, cut_penalties)
+                      for l in range(max_l+1)], dtype=float)
+    changes = np.flatnonzero(table[1:] != table[:-1])
+    last = changes[-1] + 1 if len(changes) else 0
+    return table[:max(last, 1) + 1]
+
+def score_table(n_speakers, cams, closeup_reward, wide_reward, miss_penalty):
+    """
+    score_frame() for every activity pattern and camera.
+    Row p holds the scores when speaker k is active iff bit k of p is set.
+    Returns: (2**n_speakers, len(cams)) float array
+    """
+    table = np.zeros((2**n_speakers, len(cams)))
+    for pattern in range(2**n_speakers):
+        active = [(pattern >> k) & 1 for k in range(n_speakers)]
+        for ci, cam in enumerate(cams):
+            table[pattern, ci] = score_frame(cam, active, closeup_reward,
+                                             wide_reward, miss_penalty)
+    return table
+
+def activity_patterns(frames):
+    """
+    Bit pattern of the active (nonzero) speakers in each frame.
+    frames: (n, speakers) activity
+    """
+    active = np.asarray(frames, dtype=float) != 0
+    weights = 1 << np.arange(active.shape[1])
+    return (active * weights).sum(axis=1)
+
+def frame_scores(frames, cams, closeup_reward, wide_reward, miss_penalty):
+    """
+    score_frame() for every frame and camera at once.
+    frames: (n, speakers) activity, e.g. a sequence of (s1, s2) pairs
+    Returns: (len(frames), len(cams)) float array
+    """
+    n_speakers = _speaker_count(frames)
+    table = score_table(n_speakers, cams, closeup_reward, wide_reward,
+                        miss_penalty)
+    frames = np.asarray(frames, dtype=float).reshape(-1, n_speakers)
+    return table[activity_patterns(frames)]
+
+def _dp_layer(prev_dp, curr_dp, frame_score, penalties, back_cam, back_l):
+    """
+    Advance the DP by one step.
+    prev_dp, curr_dp: (cams, max_l+1) score layers, curr_dp is overwritten
+    frame_score: (cams,) reward of each camera for this step
+    penalties: (max_l+1,) cut penalty lookup indexed by l_prev
+    back_cam, back_l: (cams, max_l+1) outputs for the (pj, l_prev) backpointers
+    Ties resolve to the first (pj, l_prev) in scan order, like the reference loop.
+    All arguments may have the same leading batch dimensions, to advance
+    several independent DPs (e.g. one per weight config) together.
+    """
+    n_cams, n_l = prev_dp.shape[-2:]
+    max_l = n_l - 1
+    stay = prev_dp + frame_score[..., None]
+
+    # Same camera: l_prev -> l_prev+1, saturating at max_l
+    curr_dp[..., 1:max_l] = stay[..., :max_l-1]
+    back_l[..., 1:max_l] = np.arange(max_l-1)
+    top = stay[..., max_l] > stay[..., max_l-1]
+    curr_dp[..., max_l] = np.where(top, stay[..., max_l], stay[..., max_l-1])
+    back_l[..., max_l] = np.where(top, max_l, max_l-1)
+    back_cam[..., 1:] = np.arange(n_cams)[:, None]
+
+    # Cut from any other camera: l_prev -> 0
+    cand = ((prev_dp[..., None, :, :] + frame_score[..., :, None, None])
+            - penalties[..., None, None, :])
+    cand[..., np.arange(n_cams), np.arange(n_cams), :] = -np.inf
+    # One row per (batch..., target camera)
+    cand = cand.reshape(-1, n_cams * n_l)
+    rows = np.arange(len(cand))
+    best = np.argmax(cand, axis=1)
+    curr_dp[..., 0] = cand[rows, best].reshape(curr_dp.shape[:-1])
+    back_cam[..., 0], back_l[..., 0] = np.divmod(best.reshape(curr_dp.shape[:-1]), n_l)
+
+def _alloc_backpointers(n, n_cams, n_l, spill_dir=None):
+    """
+    Preallocate compact (n, cams, max_l+1) backpointer arrays:
+    int8 previous camera and int16 (int32 if needed) previous l.
+    With spill_dir set, both live in temporary np.memmap files there instead of RAM.
+    """
+    shape = (n, n_cams, n_l)
+    l_dtype = np.int16 if n_l <= np.iinfo(np.int16).max else np.int32
+    if spill_dir is None:
+        return np.zeros(shape, dtype=np.int8), np.zeros(shape, dtype=l_dtype)
+
+    arrays = []
+    for dtype in (np.int8, l_dtype):
+        # Anonymous temp file; its disk space is released along with the memmap
+        f = tempfile.TemporaryFile(dir=spill_dir)
+        arrays.append(np.memmap(f, dtype=dtype, mode="w+", shape=shape))
+    return tuple(arrays)
+
+def _constant_shift(old_dp, new_dp):
+    """
+    d if new_dp == old_dp + d everywhere (same unreachable states), else None.
+    For batched layers, d is an array with one shift per layer.
+    """
+    if new_dp.ndim > 2:
+        layers = zip(old_dp.reshape((-1,) + old_dp.shape[-2:]),
+                     new_dp.reshape((-1,) + new_dp.shape[-2:]))
+        shifts = []
+        for old, new in layers:
+            shift = _constant_shift(old, new)
+            if shift is None:
+                return None
+            shifts.append(shift)
+        return np.reshape(shifts, new_dp.shape[:-2] + (1, 1))
+    finite = np.isfinite(new_dp)
+    if not np.array_equal(finite, np.isfinite(old_dp)):
+        return None
+    diff = new_dp[finite] - old_dp[finite]
+    if diff.size == 0 or np.any(diff != diff[0]):
+        return None
+    return diff[0]
+
+def _dp_forward(dp, scores, penalties, back_cam=None, back_l=None,
+                checkpoint_every=0, on_step=None, stats=None):
+    """
+    Run the DP over scores[1:], starting from dp, the layer for scores[0].
+    With batched layers (batch..., cams, max_l+1), scores is (n, batch..., cams)
+    and penalties (batch..., max_l+1).
+    back_cam, back_l: (len(scores), *dp.shape) backpointer outputs, or None to skip them
+    checkpoint_every: if set, also keep a copy of every n-th layer
+    on_step: called with the step index every PROGRESS_STEPS steps or so
+    stats: dict to fill with layer counts and reachable states per layer
+    Returns: (final layer, {step: layer} checkpoints)
+
+    Inside a run of identical scores the DP usually settles into every state
+    gaining the same amount per step. From then on the rest of the run is
+    advanced in one go: layers grow by that constant and the backpointers
+    repeat. This is only exact in integer arithmetic, so it is skipped for
+    fractional weights.
+    """
+    n = len(scores)
+    prev_dp = dp.copy()
+    curr_dp = np.empty_like(dp)
+    checkpoints = {0: dp.copy()} if checkpoint_every else {}
+    if back_cam is None:
+        scratch_cam = np.empty(dp.shape, dtype=np.int8)
+        scratch_l = np.empty(dp.shape, dtype=np.int32)
+
+    # End (exclusive) of the run of identical scores each step belongs to
+    run_end = np.empty(n, dtype=np.intp)
+    if n:
+        change = np.flatnonzero(np.any(scores[1:] != scores[:-1],
+                                       axis=tuple(range(1, scores.ndim)))) + 1
+        ends = np.append(change, n)
+        run_end[:] = np.repeat(ends, np.diff(np.concatenate(([0], ends))))
+    fast_forward = (np.all(np.mod(scores, 1) == 0)
+                    and np.all(np.mod(penalties, 1) == 0))
+
+    if stats is not None:
+        reachable = int(np.count_nonzero(np.isfinite(dp)))
+        stats.update(layers_computed=0, fast_forward_steps=0,
+                     reachable_min=reachable, reachable_max=reachable,
+                     reachable_sum=reachable if n else 0)
+
+    next_report = PROGRESS_STEPS
+    t = 1
+    while t < n:
+        if back_cam is None:
+            _dp_layer(prev_dp, curr_dp, scores[t], penalties, scratch_cam, scratch_l)
+        else:
+            _dp_layer(prev_dp, curr_dp, scores[t], penalties, back_cam[t], back_l[t])
+
+        # Roll layers forward
+        prev_dp, curr_dp = curr_dp, prev_dp
+        if checkpoint_every and t % checkpoint_every == 0:
+            checkpoints[t] = prev_dp.copy()
+
+        # Jump to the end of the run once the layer only shifts per step
+        last = run_end[t] - 1
+        shift = None
+        skipped = 0
+        if fast_forward and last > t:
+            shift = _constant_shift(curr_dp, prev_dp)
+        if shift is not None:
+            if back_cam is not None:
+                back_cam[t+1:last+1] = back_cam[t]
+                back_l[t+1:last+1] = back_l[t]
+            if checkpoint_every:
+                for c in range(t - t % checkpoint_every + checkpoint_every,
+                               last + 1, checkpoint_every):
+                    checkpoints[c] = prev_dp + (c - t) * shift
+            prev_dp = prev_dp + (last - t) * shift
+            skipped = int(last - t)
+            t = last
+
+        if stats is not None:
+            # A fast forwarded stretch keeps the same reachable states
+            reachable = int(np.count_nonzero(np.isfinite(prev_dp)))
+            stats["layers_computed"] += 1
+            stats["fast_forward_steps"] += skipped
+            stats["reachable_min"] = min(stats["reachable_min"], reachable)
+            stats["reachable_max"] = max(stats["reachable_max"], reachable)
+            stats["reachable_sum"] += reachable * (1 + skipped)
+
+        if on_step is not None and t >= next_report:
+            on_step(t)
+            next_report = t + PROGRESS_STEPS
+        t += 1
+
+    return prev_dp, checkpoints
+
+def _backtrack(back_cam, back_l, ci, l, seq):
+    """Follow backpointers from the last entry of the table to its first, appending camera indices to seq"""
+    for t in range(len(back_cam)-1, 0, -1):
+        ci, l = int(back_cam[t, ci, l]), int(back_l[t, ci, l])
+        seq.append(ci)
+    return ci, l
+
+def _dp_solve(scores, penalties, spill_dir=None, low_memory=False,
+              progress=None, stats=None):
+    """
+    Optimal camera path for per-step camera scores.
+    scores: (n, cams) reward of each camera at each step
+    penalties: (max_l+1,) cut penalty lookup indexed by frames since last cut
+    stats: dict to fill with DP statistics, see dp_edit()
+    Returns: (best_score, list of camera indices)
+    """
+    n, n_cams = scores.shape
+    max_l = len(penalties) - 1
+
+    # Init first frame
+    first_dp = np.full((n_cams, max_l+1), -np.inf)
+    first_dp[:, 0] = scores[0]
+
+    on_step = None
+    if progress is not None:
+        # The low memory replay runs the forward pass a second time
+        passes = 2 if low_memory else 1
+        on_step = lambda t: progress(t / (n * passes))
+
+    # Fill DP
+    if low_memory:
+        every = max(1, int(np.ceil(np.sqrt(n))))
+        last_dp, checkpoints = _dp_forward(first_dp, scores, penalties,
+                                           checkpoint_every=every,
+                                           on_step=on_step, stats=stats)
+    else:
+        back_cam, back_l = _alloc_backpointers(n, n_cams, max_l+1, spill_dir)
+        last_dp, _ = _dp_forward(first_dp, scores, penalties, back_cam, back_l,
+                                 on_step=on_step, stats=stats)
+
+    # Backtrack from the first best end state
+    best = int(np.argmax(last_dp))
+    best_val = last_dp.flat[best].item()
+    ci, l = divmod(best, max_l+1)
+
+    path = [ci]
+    if low_memory:
+        # Replay each segment from its checkpoint, last segment first
+        for start in reversed(range(0, n-1, every)):
+            stop = min(start + every, n-1)
+            back_cam, back_l = _alloc_backpointers(stop - start + 1, n_cams,
+                                                   max_l+1, spill_dir)
+            _dp_forward(checkpoints[start], scores[start:stop+1], penalties,
+                        back_cam, back_l)
+            ci, l = _backtrack(back_cam, back_l, ci, l, path)
+            if progress is not None:
+                progress((2*n - start) / (2*n))
+    else:
+        _backtrack(back_cam, back_l, ci, l, path)
+
+    path.reverse()
+    if stats is not None:
+        stats["steps"] = n
+        stats["states_per_layer"] = n_cams * (max_l+1)
+        stats["reachable_mean"] = stats.pop("reachable_sum") / max(n, 1)
+        stats["score"] = best_val
+        stats["cuts"] = sum(a != b for a, b in zip(path, path[1:]))
+    return best_val, path
+
+def _downsample(frames, stride):
+    if isinstance(frames, Runs):
+        return frames.every(stride)
+    return frames[::stride]
+
+def _speaker_count(frames):
+    frames = np.asarray(frames)
+    return frames.shape[1] if frames.ndim == 2 else 2
+
+def _segments(seq, stride, length):
+    """Runs of a downsampled camera sequence at full frame length, without expanding it"""
+    runs = Runs.encode(np.asarray(seq, dtype=np.int64))
+    starts = runs.starts * stride
+    lengths = runs.lengths * stride
+    # Adjust length in case frames not divisible by stride
+    if len(lengths):
+        lengths[-1] = length - starts[-1]
+    return Runs(starts, lengths, runs.values)
+
 def dp_edit(frames,
             close_cam_reward, wide_reward, miss_speaker_penalty,
             cut_splits, cut_penalties,
-            stride=5, max_l=300):
+            stride=5, max_l=300, spill_dir=None, low_memory=False,
+            progress=None, stats=None):
     """
     DP for optimal edit sequence with nonlinear cut penalty.
-    frames: list of (s1, s2, sentence_break) -- sentence_break ignored here
+    frames: sequence of per-frame speaker activity, e.g. (s1, s2) pairs,
+            or Runs of them. There is a close-up camera for every speaker,
+            plus the wide shot.
     stride: how many frames to skip between DP steps (downsampling)
-    max_l: maximum "frames since last cut" tracked
-    Returns: (best_score, compressed_seq, expanded_seq)
+    max_l: maximum "frames since last cut" tracked. Only an upper bound: the
+           DP stops at the last cut_splits value when that comes first.
+    spill_dir: if set, keep the backpointer table in np.memmap files in this directory
+    low_memory: only keep DP layers every ~sqrt(n) steps and recompute the
+                backpointers segment by segment while backtracking. Same result,
+                O(sqrt(n) * max_l) memory, roughly twice the run time.
+    progress: called now and then with the fraction of work done. It may
+              raise to abort the DP.
+    stats: dict to fill with DP statistics: steps, layers computed and fast
+           forwarded, reachable states per layer (min/mean/max), score and cuts
+    Returns: (best_score, compressed_seq, segments), segments being Runs of
+             the camera at full frame length: (start, length, cam) arrays.
+             Iterate over it or decode() it for the camera of every frame.
     """
+    if max_l < 1:
+        raise ValueError("max_l must be at least 1")
+
     # Downsample input frames
-    frames_ds = frames[::stride]
-    n = len(frames_ds)
-    cams = [Cam.WIDE, Cam.C1, Cam.C2]
+    frames_ds = _downsample(frames, stride)
+    cams = Cam.all(_speaker_count(frames_ds))
 
-    # Two rolling DP layers
-    prev_dp = [[-float('inf')] * (max_l+1) for _ in cams]
-    curr_dp = [[-float('inf')] * (max_l+1) for _ in cams]
+    scores = frame_scores(frames_ds, cams, close_cam_reward, wide_reward,
+                          miss_speaker_penalty)
+    penalties = cut_penalty_table(max_l, cut_splits, cut_penalties)
 
-    # Backpointer storage
-    back = [[[-1] * (max_l+1) for _ in cams] for _ in range(n)]
+    best_val, path = _dp_solve(scores, penalties, spill_dir, low_memory,
+                               progress, stats)
+    seq = [cams[ci] for ci in path]  # compressed sequence
+    return best_val, seq, _segments(seq, stride, len(frames))
 
-    # Init first frame
-    s1, s2 = frames_ds[0]
-    for ci, cam in enumerate(cams):
-        prev_dp[ci][0] = score_frame(cam, s1, s2,
-                                     close_cam_reward, wide_reward,
-                                     miss_speaker_penalty)
+def dp_edit_batch(frames, configs, stride=5, max_l=300, spill_dir=None,
+                  progress=None):
+    """
+    dp_edit() for several weight configs in one pass over the frames. All
+    configs' DP layers advance together as one (configs, cams, l) array per
+    step, so the per-step overhead is shared.
+    configs: sequence of (close_cam_reward, wide_reward, miss_speaker_penalty,
+             cut_splits, cut_penalties), in dp_edit()'s argument order
+    Returns: [(best_score, compressed_seq, segments), ...], one per config,
+             each the same as dp_edit() gives
+    """
+    if max_l < 1:
+        raise ValueError("max_l must be at least 1")
+    if not len(configs):
+        return []
 
-    # Fill DP
-    for t in range(1, n):
-        s1, s2 = frames_ds[t]
-        frame_score = [score_frame(cam, s1, s2,
-                                   close_cam_reward, wide_reward,
-                                   miss_speaker_penalty) for cam in cams]
+    frames_ds = _downsample(frames, stride)
+    n_speakers = _speaker_count(frames_ds)
+    cams = Cam.all(n_speakers)
+    patterns = activity_patterns(np.asarray(frames_ds, dtype=float)
+                                 .reshape(-1, n_speakers))
+    tables = []
+    penalty_tables = []
+    for close_cam_reward, wide_reward, miss_penalty, cut_splits, cut_penalties in configs:
+        tables.append(score_table(n_speakers, cams, close_cam_reward,
+                                  wide_reward, miss_penalty))
+        penalty_tables.append(cut_penalty_table(max_l, cut_splits, cut_penalties))
 
-        # Reset current layer
-        for ci in range(len(cams)):
-            for l in range(max_l+1):
-                curr_dp[ci][l] = -float('inf')
+    # Pad the pruned penalty tables to a common length with their last
+    # value, which is what they were pruned of, so every path scores the same
+    n_l = max(len(table) for table in penalty_tables)
+    penalties = np.array([np.pad(table, (0, n_l - len(table)), mode="edge")
+                          for table in penalty_tables])
+    # (steps, configs, cams), read from the shared activity patterns
+    scores = np.stack(tables, axis=1)[patterns]
 
-        for ci, cam in enumerate(cams):
-            for pj, prev_cam in enumerate(cams):
-                for l_prev, prev_score in enumerate(prev_dp[pj]):
-                    if prev_score == -float('inf'):
-                        continue
-
-                    if cam == prev_cam:
-                        l_new = min(l_prev+1, max_l)
-                        cand = prev_score + frame_score[ci]
-                    else:
-                        penalty = cut_penalty(l_prev, cut_splits, cut_penalties)
-                        l_new = 0
-                        cand = prev_score + frame_score[ci] - penalty
-
-                    if cand > curr_dp[ci][l_new]:
-                        curr_dp[ci][l_new] = cand
-                        back[t][ci][l_new] = (pj, l_prev)
+    n, k = len(scores), len(configs)
+    first_dp = np.full((k, len(cams), n_l), -np.inf)
+    first_dp[:, :, 0] = scores[0]
+    back_cam, back_l = _alloc_backpointers(n, k * len(cams), n_l, spill_dir)
+    back_cam = back_cam.reshape(n, k, len(cams), n_l)
+    back_l = back_l.reshape(n, k, len(cams), n_l)
+    on_step = None
+    if progress is not None:
+        on_step = lambda t: progress(t / n)
+    last_dp, _ = _dp_forward(first_dp, scores, penalties, back_cam, back_l,
+                             on_step=on_step)
 
-        # Roll layers forward
-        prev_dp, curr_dp = curr_dp, prev_dp
+    results = []
+    for c in range(k):
+        best = int(np.argmax(last_dp[c]))
+        ci, l = divmod(best, n_l)
+        path = [ci]
+        _backtrack(back_cam[:, c], back_l[:, c], ci, l, path)
+        path.reverse()
+        seq = [cams[ci] for ci in path]
+        results.append((last_dp[c].flat[best].item(), seq,
+                        _segments(seq, stride, len(frames))))
+    return results
 
-    # Backtrack
-    best_val = -float('inf')
-    best_state = None
-    for ci in range(len(cams)):
-        for l in range(max_l+1):
-            if prev_dp[ci][l] > best_val:
-                best_val = prev_dp[ci][l]
-                best_state = (ci, l)
-
-    seq = []
-    t = n-1
-    ci, l = best_state
-    while t >= 0:
-        seq.append(cams[ci])
-        prev = back[t][ci][l]
-        if prev == -1 or prev is None:
+# === SHARDED CUTTING ===
+def path_states(path, max_l):
+    """Frames since last cut (capped at max_l) at every step of a camera path"""
+    path = np.asarray(path)
+    t = np.arange(len(path))
+    run_start = np.where(np.r_[True, path[1:] != path[:-1]], t, 0)
+    return np.minimum(t - np.maximum.accumulate(run_start), max_l)
+
+def path_score(scores, path, penalties):
+    """dp_edit objective of a camera index path: frame rewards minus cut penalties"""
+    path = np.asarray(path)
+    l = path_states(path, len(penalties) - 1)
+    cuts = np.flatnonzero(path[1:] != path[:-1])  # Cut between step c and c+1
+    return (scores[np.arange(len(path)), path].sum()
+            - penalties[l[cuts]].sum()).item()
+
+def _shard_bounds(scores, shard_steps):
+    """
+    Shard boundaries about shard_steps apart. Each one is moved into the
+    middle of the longest stretch of mutual silence (all camera scores 0)
+    within a quarter shard of it.
+    """
+    n = len(scores)
+    silent = ~np.any(scores != 0, axis=1)
+    reach = shard_steps // 4
+    bounds = [0]
+    for b in range(shard_steps, n, shard_steps):
+        if b + reach >= n:
             break
-        ci, l = prev
-        t -= 1
+        runs = Runs.encode(silent[b - reach:b + reach])
+        quiet = np.flatnonzero(runs.values)
+        if len(quiet):
+            k = quiet[np.argmax(runs.lengths[quiet])]
+            b += int(runs.starts[k] + runs.lengths[k] // 2) - reach
+        bounds.append(b)
+    bounds.append(n)
+    return bounds
 
-    seq.reverse()  # compressed sequence
+def _find_join(path_a, lo_a, path_b, lo_b, first, stop, target, max_l):
+    """
+    Step in [first, stop) at which to switch from path_a to path_b (each
+    starting at step lo_a / lo_b), closest to target. Prefers steps where
+    both agree on the camera and the frames since last cut.
+    Returns: (step, whether both agreed on the full state)
+    """
+    cam_a = np.asarray(path_a[first - lo_a:stop - lo_a])
+    cam_b = np.asarray(path_b[first - lo_b:stop - lo_b])
+    l_a = path_states(path_a, max_l)[first - lo_a:stop - lo_a]
+    l_b = path_states(path_b, max_l)[first - lo_b:stop - lo_b]
 
-    # Expand back to full frame length
-    expanded = []
-    for cam in seq:
-        expanded.extend([cam] * stride)
-    # Adjust length in case frames not divisible by stride
-    expanded = expanded[:len(frames)]
+    same_cam = cam_a == cam_b
+    for agree, exact in ((same_cam & (l_a == l_b), True), (same_cam, False)):
+        steps = np.flatnonzero(agree) + first
+        if len(steps):
+            return int(steps[np.argmin(np.abs(steps - target))]), exact
+    return min(max(target, first), stop - 1), False
+
+def _solve_shard(scores, penalties):
+    return _dp_solve(scores, penalties)[1]
+
+def dp_edit_sharded(frames,
+                    close_cam_reward, wide_reward, miss_speaker_penalty,
+                    cut_splits, cut_penalties,
+                    stride=5, max_l=300, shard_steps=12000, overlap=1000,
+                    workers=None, verify=False, progress=None):
+    """
+    dp_edit split into time shards that are solved in parallel processes.
+    Shard boundaries sit in mutual silences where possible, and every shard
+    is solved with `overlap` extra DP steps on each side. Neighbouring
+    shards are stitched at a step inside their overlap where both paths
+    agree on the camera and the frames since last cut. The rest of the
+    later path is then an optimal continuation of the earlier one. Without
+    such a step the result can score a little below dp_edit.
+    shard_steps, overlap: in DP steps (downsampled frames). overlap should
+                          be well above the cut penalty horizon.
+    workers: processes to use (default: one per CPU)
+    verify: also run the exact single pass DP and report the score gap
+    Returns: (score, compressed_seq, segments, report dict), see dp_edit()
+    """
+    if max_l < 1:
+        raise ValueError("max_l must be at least 1")
+    overlap = min(overlap, shard_steps // 2)
+
+    frames_ds = _downsample(frames, stride)
+    n = len(frames_ds)
+    cams = Cam.all(_speaker_count(frames_ds))
+
+    scores = frame_scores(frames_ds, cams, close_cam_reward, wide_reward,
+                          miss_speaker_penalty)
+    penalties = cut_penalty_table(max_l, cut_splits, cut_penalties)
+
+    bounds = _shard_bounds(scores, shard_steps)
+    windows = [(max(0, start - overlap), min(n, stop + overlap))
+               for start, stop in zip(bounds, bounds[1:])]
+
+    paths = [None] * len(windows)
+    if len(windows) == 1:
+        paths[0] = _solve_shard(scores, penalties)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_solve_shard, scores[lo:hi], penalties): k
+                       for k, (lo, hi) in enumerate(windows)}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    paths[futures[future]] = future.result()
+                    if progress is not None:
+                        progress(done / len(windows))
+            except BaseException:
+                # Aborted, e.g. progress raised to cancel: drop the shards
+                # that haven't started instead of solving them all first
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    # Stitch each shard's path onto the next inside their overlap
+    path = np.empty(n, dtype=np.intp)
+    filled = 0
+    exact_joins = 0
+    for k, (lo, hi) in enumerate(windows):
+        stop = n
+        if k + 1 < len(windows):
+            next_lo = windows[k+1][0]
+            join, exact = _find_join(paths[k], lo, paths[k+1], next_lo,
+                                     max(next_lo, filled), hi,
+                                     bounds[k+1], len(penalties) - 1)
+            exact_joins += exact
+            stop = join + 1
+        path[filled:stop] = paths[k][filled - lo:stop - lo]
+        filled = stop
+
+    score = path_score(scores, path, penalties)
+    report = {"shards": len(windows), "joins": len(windows) - 1,
+              "exact_joins": exact_joins, "score": score,
+              "cuts": int(np.count_nonzero(path[1:] != path[:-1]))}
+    if verify:
+        exact_score, _ = _dp_solve(scores, penalties)
+        report["exact_score"] = exact_score
+        report["score_gap"] = exact_score - score
 
-    return best_val, seq, expanded
+    seq = [cams[ci] for ci in path.tolist()]  # compressed sequence
+    return score, seq, _segments(seq, stride, len(frames)), report
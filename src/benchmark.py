@@ -0,0 +1,223 @@
+"""
+Benchmarks for the editing pipeline on synthetic speaker tracks. Never imports Qt.
+
+    python -m benchmark --minutes 10 60 360 --rate 48000 -o bench.json
+    python -m benchmark --minutes 10 60 -o new.json --compare old.json
+
+The synthetic episodes are deterministic for a given length, sample rate
+and seed: speakers alternate in bursts, with crosstalk, short
+interjections, silence, bleed between the mics and a noise floor. They
+are written once to --audio-dir and reused.
+
+Every pipeline stage is timed. With --memory each episode is edited a
+second time with tracemalloc on, to record every stage's peak traced
+memory; tracing slows the pipeline down several times, so it never runs
+during the timed pass. The results are written as JSON, so they can be
+compared between commits with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from editor import Editor
+
+BLEED = 0.08  # Level of the other speakers in each mic
+NOISE_FLOOR = 0.003
+CHUNK_SECONDS = 10  # Audio generated per write
+
+def synth_schedule(seconds, n_speakers, seed):
+    """
+    Who talks when: [(start_s, end_s, speakers), ...] covering the whole episode.
+    Mostly one speaker at a time, sometimes crosstalk, interjections or silence.
+    """
+    rng = np.random.default_rng([seed, 0])
+    schedule = []
+    t = 0.0
+    speaker = 0
+    while t < seconds:
+        kind = rng.choice(["turn", "crosstalk", "interjection", "silence"],
+                          p=[0.7, 0.1, 0.1, 0.1])
+        if kind == "turn":
+            speaker = (speaker + 1 + rng.integers(n_speakers - 1)) % n_speakers
+            length, speakers = rng.uniform(2, 30), (speaker,)
+        elif kind == "crosstalk":
+            length = rng.uniform(0.5, 4)
+            speakers = tuple(rng.choice(n_speakers, 2, replace=False))
+        elif kind == "interjection":
+            length = rng.uniform(0.2, 0.8)
+            speakers = (int(rng.integers(n_speakers)),)
+        else:
+            length, speakers = rng.uniform(0.5, 5), ()
+        schedule.append((t, min(t + length, seconds), speakers))
+        t += length
+    return schedule
+
+def synth_chunk(schedule, start, length, sample_rate, n_speakers, seed, index):
+    """(length, n_speakers) mic signals from sample start on"""
+    rng = np.random.default_rng([seed, 1, index])
+    t = (start + np.arange(length)) / sample_rate
+
+    # Each voice is noise with a syllable-rate envelope
+    voices = np.zeros((length, n_speakers), dtype=np.float32)
+    for begin, end, speakers in schedule:
+        if end <= t[0] or begin > t[-1]:
+            continue
+        inside = (t >= begin) & (t < end)
+        for k in speakers:
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * (4 + k/3) * t[inside] + k)
+            voices[inside, k] = 0.25 * envelope * rng.standard_normal(np.count_nonzero(inside))
+
+    # Every mic also picks up the other speakers
+    mix = np.full((n_speakers, n_speakers), BLEED, dtype=np.float32)
+    np.fill_diagonal(mix, 1)
+    mics = voices @ mix
+    mics += NOISE_FLOOR * rng.standard_normal(mics.shape).astype(np.float32)
+    return np.clip(mics, -1, 1)
+
+def synth_episode(audio_dir, minutes, sample_rate, n_speakers=2, seed=0):
+    """Write (or reuse) the synthetic mic tracks of one episode. Returns their paths."""
+    name = f"synth_{minutes:g}min_{sample_rate}hz_seed{seed}"
+    paths = [os.path.join(audio_dir, f"{name}_speaker{k+1}.wav")
+             for k in range(n_speakers)]
+    if all(os.path.exists(path) for path in paths):
+        return paths
+
+    os.makedirs(audio_dir, exist_ok=True)
+    total = int(minutes * 60 * sample_rate)
+    schedule = synth_schedule(minutes * 60, n_speakers, seed)
+    chunk = CHUNK_SECONDS * sample_rate
+    tmp_paths = [path + ".tmp" for path in paths]
+    files = [sf.SoundFile(path, "w", sample_rate, 1, "PCM_16", format="WAV")
+             for path in tmp_paths]
+    try:
+        for index, start in enumerate(range(0, total, chunk)):
+            mics = synth_chunk(schedule, start, min(chunk, total - start),
+                               sample_rate, n_speakers, seed, index)
+            for k, f in enumerate(files):
+                f.write(mics[:, k])
+    finally:
+        for f in files:
+            f.close()
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+    return paths
+
+def bench_episode(paths, settings, trace=False):
+    """
+    Edit one episode.
+    trace: run it with tracemalloc on, for the stages' peak memory. Not for timing.
+    Returns: (Editor.report of the job, number of frames)
+    """
+    editor = Editor(None)
+    editor.energy_cache_dir = None
+    for setting, value in settings.items():
+        setattr(editor, setting, value)
+
+    if trace:
+        tracemalloc.start()
+    try:
+        editor.load_audio(*paths)
+        editor.process_audio()
+        with tempfile.TemporaryDirectory() as output_dir:
+            editor.export_cuts(output_dir)
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return editor.report, len(editor.cam_segments)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print the wall time ratio of every stage against a previous results file"""
+    old_runs = {(r["minutes"], r["sample_rate"], r["speakers"]): r
+                for r in baseline["runs"]}
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'} (new/old wall time):")
+    for run in results["runs"]:
+        old = old_runs.get((run["minutes"], run["sample_rate"], run["speakers"]))
+        if old is None:
+            continue
+        ratios = []
+        for stage, new in run["stages"].items():
+            if stage in old["stages"] and old["stages"][stage]["wall_s"] > 0:
+                ratios.append(f"{stage} {new['wall_s'] / old['stages'][stage]['wall_s']:.2f}x")
+        print(f"  {run['minutes']:g} min @ {run['sample_rate']} Hz: " + ", ".join(ratios))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark",
+                                     description="Time the CamVAD pipeline on synthetic episodes.")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10],
+                        help="episode lengths to run (default: 10)")
+    parser.add_argument("--rate", type=int, nargs="+", default=[48000],
+                        help="sample rates to run, e.g. 44100 48000 (default: 48000)")
+    parser.add_argument("--speakers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--audio-dir", default=os.path.join(tempfile.gettempdir(), "camvad-bench"),
+                        help="where the synthetic tracks are kept between runs")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="override an Editor setting, e.g. --set streaming=True")
+    parser.add_argument("--memory", action="store_true",
+                        help="also record each stage's peak memory, in a separate traced run")
+    args = parser.parse_args(argv)
+
+    from camvad import parse_settings
+    settings = parse_settings(args.set)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "settings": settings,
+        "runs": [],
+    }
+    for sample_rate in args.rate:
+        for minutes in args.minutes:
+            paths = synth_episode(args.audio_dir, minutes, sample_rate,
+                                  args.speakers, args.seed)
+            report, frames = bench_episode(paths, settings)
+            stages = {record.name: {"wall_s": round(record.wall_s, 4),
+                                    "cpu_s": round(record.cpu_s, 4),
+                                    "peak_mb": None}
+                      for record in report.stages}
+            if args.memory:
+                traced, _ = bench_episode(paths, settings, trace=True)
+                for record in traced.stages:
+                    if record.name in stages:
+                        stages[record.name]["peak_mb"] = record.peak_mb
+            total = report.total_s()
+            results["runs"].append({"minutes": minutes, "sample_rate": sample_rate,
+                                    "speakers": args.speakers, "seed": args.seed,
+                                    "frames": frames, "total_s": round(total, 3),
+                                    "stages": stages, "dp": report.dp})
+            print(f"{minutes:g} min @ {sample_rate} Hz: {total:.2f}s  " +
+                  "  ".join(f"{name} {s['wall_s']:.2f}s" +
+                            (f"/{s['peak_mb']:.0f}MB" if s["peak_mb"] is not None else "")
+                            for name, s in stages.items()), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Headless command line for CamVAD. Never imports Qt.
+
+    python -m camvad edit speaker1.wav speaker2.wav [speaker3.wav ...] -o out/
+    python -m camvad batch episodes.csv -o out/ --jobs 4
+    python -m camvad live speaker1.wav speaker2.wav --latency 5
+    some-capture | python -m camvad live - --channels 2 --rate 48000
+
+A batch manifest is a CSV file with one episode per row: each speaker's
+audio in order, then optionally an episode name. The name is the column
+without a file extension. Relative paths are resolved against the
+manifest's folder.
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from audio_io import file_blocks, pcm_blocks
+from audio_processing import Cam
+from decoders import DecodeError, get_decoder
+from editor import Editor
+from online import OnlineEditor
+from sweep import grid_configs, random_configs, sweep
+
+def parse_settings(pairs):
+    """Turn ["name=value", ...] into Editor setting overrides"""
+    settings = {}
+    defaults = Editor(None)
+    for pair in pairs or []:
+        name, sep, value = pair.partition("=")
+        if not sep or not hasattr(defaults, name):
+            raise ValueError(f"unknown setting: {pair}")
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+    return settings
+
+def run_episode(name, paths, output_dir, settings, report=False):
+    """
+    Edit one episode into output_dir. Returns a summary dict with per-step timings.
+    report: also write the per-stage report.json and a trace.json (Chrome trace format) there
+    """
+    summary = {"name": name, "audio": list(paths), "output_dir": output_dir}
+    start = time.perf_counter()
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        editor = Editor(None)
+        for setting, value in settings.items():
+            setattr(editor, setting, value)
+
+        step = time.perf_counter()
+        for label, run in (("load_s", lambda: editor.load_audio(*paths)),
+                           ("process_s", editor.process_audio),
+                           ("export_s", lambda: editor.export_cuts(output_dir))):
+            run()
+            now = time.perf_counter()
+            summary[label] = round(now - step, 3)
+            step = now
+        summary["status"] = "ok"
+        if editor.analysis_rate:
+            summary["analysis_rate"] = editor.effective_analysis_rate()
+        if report:
+            editor.report.write_json(os.path.join(output_dir, "report.json"))
+            editor.report.write_chrome_trace(os.path.join(output_dir, "trace.json"))
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["total_s"] = round(time.perf_counter() - start, 3)
+    return summary
+
+def read_manifest(path):
+    """Returns: [(name, [audio paths]), ...]"""
+    base = os.path.dirname(os.path.abspath(path))
+    episodes = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            name = None
+            if not os.path.splitext(row[-1])[1]:
+                name = row.pop()
+            paths = [os.path.join(base, p) for p in row if p]
+            if len(paths) < 2:
+                raise ValueError(f"manifest row needs two or more audio files: {row}")
+            if not name:
+                name = os.path.splitext(os.path.basename(paths[0]))[0]
+            episodes.append((name, paths))
+
+    names = [name for name, _ in episodes]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"duplicate episode names: {', '.join(sorted(duplicates))}")
+    return episodes
+
+def print_summary(summaries):
+    for s in summaries:
+        if s["status"] == "ok":
+            print(f"{s['name']}: ok in {s['total_s']:.1f}s "
+                  f"(load {s['load_s']:.1f}s, process {s['process_s']:.1f}s, "
+                  f"export {s['export_s']:.1f}s)" +
+                  (f", voice detection at {s['analysis_rate']} Hz" if "analysis_rate" in s else ""))
+        else:
+            print(f"{s['name']}: FAILED after {s['total_s']:.1f}s - {s['error']}")
+
+def cmd_edit(args):
+    if len(args.audio) < 2:
+        raise ValueError("edit needs a recording for each of at least two speakers")
+    summary = run_episode("edit", args.audio, args.output,
+                          parse_settings(args.set), args.report)
+    print_summary([summary])
+    return 0 if summary["status"] == "ok" else 1
+
+def cmd_batch(args):
+    settings = parse_settings(args.set)
+    episodes = read_manifest(args.manifest)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_episode, name, paths,
+                               os.path.join(args.output, name), settings,
+                               args.report)
+                   for name, paths in episodes]
+        summaries = [future.result() for future in futures]
+
+    report = {"total_s": round(time.perf_counter() - start, 3),
+              "episodes": summaries}
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "summary.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_summary(summaries)
+    failed = sum(s["status"] != "ok" for s in summaries)
+    print(f"{len(summaries) - failed}/{len(summaries)} episodes edited "
+          f"in {report['total_s']:.1f}s")
+    return 0 if not failed else 1
+
+def cmd_live(args):
+    editor = Editor(None)
+    for setting, value in parse_settings(args.set).items():
+        setattr(editor, setting, value)
+
+    if args.audio == ["-"]:
+        if not args.rate or args.channels < 2:
+            raise ValueError("reading from stdin needs --rate and --channels (2 or more)")
+        sample_rate = args.rate
+        n_speakers = args.channels
+        blocks = pcm_blocks(sys.stdin.buffer, args.channels,
+                            args.block_ms * sample_rate // 1000, args.format)
+    else:
+        if len(args.audio) < 2:
+            raise ValueError("live needs a recording for each of at least two speakers")
+        decoder = get_decoder(editor.decoder)
+        sample_rates = {decoder.info(path).sample_rate for path in args.audio}
+        if len(sample_rates) != 1:
+            raise ValueError("the recordings have different sample rates")
+        sample_rate = sample_rates.pop()
+        n_speakers = len(args.audio)
+        blocks = file_blocks(args.audio, args.block_ms * sample_rate // 1000,
+                             decoder)
+
+    online = OnlineEditor(editor, n_speakers, sample_rate, latency=args.latency)
+    # On stderr, so stdout is only the camera changes
+    print(f"cameras are committed up to {online.delay():.2f}s after their audio",
+          file=sys.stderr, flush=True)
+
+    # One line per camera change, as soon as it is committed
+    last_cam = None
+    for start, _, cam in online.stream(blocks):
+        if cam != last_cam:
+            print(f"{start * editor.frame_ms / 1000:10.2f}s  {Cam.name(cam)}",
+                  flush=True)
+            last_cam = cam
+    return 0
+
+def cmd_check_analysis(args):
+    if len(args.audio) < 2:
+        raise ValueError("check-analysis needs a recording for each of at least two speakers")
+    editor = Editor(None)
+    for setting, value in parse_settings(args.set).items():
+        setattr(editor, setting, value)
+    editor.analysis_rate = args.rate
+    print(json.dumps(editor.validate_analysis_rate(*args.audio), indent=2))
+    return 0
+
+def cmd_sweep(args):
+    if len(args.audio) < 2:
+        raise ValueError("sweep needs a recording for each of at least two speakers")
+    space = parse_settings(args.vary)
+    if not space:
+        raise ValueError("nothing to sweep, add --vary NAME=VALUES")
+    if args.random:
+        configs = random_configs(space, args.random, args.seed)
+    else:
+        for name, values in space.items():
+            if not isinstance(values, list):
+                raise ValueError(f"{name}: a grid needs a list of values, e.g. [4,5,6]")
+        configs = grid_configs(space)
+
+    editor = Editor(None)
+    for setting, value in parse_settings(args.set).items():
+        setattr(editor, setting, value)
+    start = time.perf_counter()
+    editor.load_audio(*args.audio)
+    results = sweep(editor, configs, workers=args.jobs)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        m = result["metrics"]
+        settings = " ".join(f"{name}={value!r}" for name, value in result["settings"].items())
+        print(f"{settings}\n    score {m['score']:g}, {m['cuts']} cuts, "
+              f"mean shot {m['mean_shot_s']:.1f}s, wide {m['wide_ratio']:.0%}, "
+              f"{m['miss_frames']} missed speaker frames")
+    print(f"{len(results)} configs in {elapsed:.1f}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"total_s": round(elapsed, 3), "results": results}, f, indent=2)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="camvad",
+                                     description="Automatic multicam editing from speaker audio.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    edit = commands.add_parser("edit", help="edit a single episode")
+    edit.add_argument("audio", nargs="+", help="mic recording of each speaker, in order")
+    edit.set_defaults(func=cmd_edit)
+
+    batch = commands.add_parser("batch", help="edit every episode in a CSV manifest")
+    batch.add_argument("manifest", help="CSV rows of: speaker 1 audio, speaker 2 audio, ...[, name]")
+    batch.add_argument("-j", "--jobs", type=int, default=None,
+                       help="parallel episodes (default: one per CPU)")
+    batch.set_defaults(func=cmd_batch)
+
+    live = commands.add_parser("live", help="print camera changes while the audio streams in")
+    live.add_argument("audio", nargs="+",
+                      help="mic recording of each speaker, or - for raw PCM on stdin")
+    live.add_argument("--latency", type=float, default=5.0,
+                      help="seconds to wait before committing a camera (default: 5)")
+    live.add_argument("--block-ms", type=int, default=100,
+                      help="audio read per block, in milliseconds (default: 100)")
+    live.add_argument("--channels", type=int, default=0,
+                      help="stdin only: interleaved channels, one per speaker")
+    live.add_argument("--rate", type=int, default=0, help="stdin only: sample rate")
+    live.add_argument("--format", default="int16",
+                      help="stdin only: sample type, e.g. int16, int32 or float32")
+    live.add_argument("--set", action="append", metavar="NAME=VALUE",
+                      help="override an Editor setting")
+    live.set_defaults(func=cmd_live)
+
+    check = commands.add_parser("check-analysis",
+                                help="compare voice detection at a low analysis rate with full rate")
+    check.add_argument("audio", nargs="+", help="mic recording of each speaker, in order")
+    check.add_argument("--rate", type=int, default=16000,
+                       help="analysis rate in Hz (default: 16000)")
+    check.add_argument("--set", action="append", metavar="NAME=VALUE",
+                       help="override an Editor setting")
+    check.set_defaults(func=cmd_check_analysis)
+
+    tune = commands.add_parser("sweep", help="compare editing style settings on one episode")
+    tune.add_argument("audio", nargs="+", help="mic recording of each speaker, in order")
+    tune.add_argument("--vary", action="append", metavar="NAME=VALUES",
+                      help="values to try, e.g. --vary wide_reward=[3,4,5]. "
+                           "With --random also a (low, high) range.")
+    tune.add_argument("--random", type=int, metavar="N",
+                      help="try N random configs instead of every combination")
+    tune.add_argument("--seed", type=int, default=0, help="seed for --random")
+    tune.add_argument("-j", "--jobs", type=int, default=None,
+                      help="parallel configs (default: one per CPU)")
+    tune.add_argument("-o", "--output", help="also write the results to this JSON file")
+    tune.add_argument("--set", action="append", metavar="NAME=VALUE",
+                      help="override an Editor setting for every config")
+    tune.set_defaults(func=cmd_sweep)
+
+    for command in (edit, batch):
+        command.add_argument("-o", "--output", default=".",
+                             help="folder for the EDL files")
+        command.add_argument("--set", action="append", metavar="NAME=VALUE",
+                             help="override an Editor setting, e.g. --set cut_penalties=[60,35,2]")
+        command.add_argument("--report", action="store_true",
+                             help="write per-stage timings (report.json, trace.json) next to the EDLs")
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError, DecodeError) as e:
+        parser.exit(2, f"camvad: error: {e}\n")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Audio decoder backends. A backend reads any sample window of a file, and
+can decimate as it reads, so only the samples an edit needs get decoded.
+
+Backends are registered by name in DECODERS; Editor.decoder picks one.
+A backend needs:
+    info(path) -> AudioInfo
+    read(path, start=0, stop=None, decimate=1, dtype="float64", on_block=None)
+        -> (samples, channels) array. on_block, if given, is called with the
+        number of file samples decoded after each block, and may raise to abort.
+    blocks(path, blocksize, start=0, stop=None, decimate=1, dtype="float32")
+        -> iterator of (samples, channels) arrays
+start and stop are sample indices at the file's own rate. decimate=k low
+pass filters and keeps one sample in k, so the result runs at sample_rate / k.
+"""
+import json
+import subprocess
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import soundfile as sf
+
+AudioInfo = namedtuple("AudioInfo", "sample_rate frames channels")
+
+class DecodeError(RuntimeError):
+    """A decoder backend couldn't read a file"""
+
+def time_window(info, start_time=None, end_time=None):
+    """
+    (start, stop) sample indices of a window given in seconds, clipped to the file.
+    Raises ValueError if no samples are left.
+    """
+    if start_time is not None and end_time is not None and end_time <= start_time:
+        raise ValueError(f"end_time ({end_time}s) must be after start_time ({start_time}s)")
+    start = max(int(round((start_time or 0) * info.sample_rate)), 0)
+    stop = info.frames
+    if end_time is not None:
+        stop = min(stop, int(round(end_time * info.sample_rate)))
+    if start >= stop:
+        length = info.frames / info.sample_rate
+        if start_time is None and end_time is None:
+            raise ValueError("the recording is empty")
+        if start >= info.frames:
+            raise ValueError(f"start_time ({start_time}s) is past the end of "
+                             f"the {length:.1f}s recording")
+        raise ValueError(f"end_time ({end_time}s) leaves no audio to edit")
+    return start, stop
+
+def block_average(block, factor):
+    """Decimate a (samples, channels) block by averaging each run of factor samples"""
+    n = len(block) // factor * factor
+    channels = block.shape[1]
+    # As one matrix product, which is much faster than a mean over a short axis:
+    # each row holds factor samples of every channel, weights pick out one channel each
+    weights = np.tile(np.eye(channels, dtype=block.dtype), (factor, 1)) / factor
+    out = block[:n].reshape(-1, factor * channels) @ weights
+    if n < len(block):
+        # Partial run at the end of the file
+        tail = block[n:].mean(axis=0, keepdims=True, dtype=block.dtype)
+        out = np.concatenate((out, tail))
+    return out
+
+class SoundFileDecoder:
+    """
+    libsndfile: WAV, FLAC, AIFF, Ogg and (libsndfile 1.1+) MP3. Seeks
+    straight to start. Decimation averages each run of decimate samples,
+    a box low pass.
+    """
+    def info(self, path):
+        try:
+            info = sf.info(path)
+        except (OSError, RuntimeError) as e:
+            raise DecodeError(f"{path}: {e}") from e
+        return AudioInfo(info.samplerate, info.frames, info.channels)
+
+    def read(self, path, start=0, stop=None, decimate=1, dtype="float64",
+             on_block=None):
+        if decimate > 1:
+            blocks = []
+            for block in self.blocks(path, 2**20, start, stop, decimate, dtype):
+                blocks.append(block)
+                if on_block is not None:
+                    on_block(len(block) * decimate)
+            if not blocks:
+                return np.zeros((0, self.info(path).channels), dtype=dtype)
+            return np.concatenate(blocks)
+        if on_block is None:
+            try:
+                audio, _ = sf.read(path, start=start, stop=stop, dtype=dtype,
+                                   always_2d=True)
+            except (OSError, RuntimeError) as e:
+                raise DecodeError(f"{path}: {e}") from e
+            return audio
+        # Block by block into one array, to report progress in between
+        try:
+            with sf.SoundFile(path) as f:
+                f.seek(start)
+                stop = f.frames if stop is None else min(stop, f.frames)
+                audio = np.empty((max(0, stop - start), f.channels), dtype=dtype)
+                filled = 0
+                while filled < len(audio):
+                    n = len(f.read(out=audio[filled:filled + 2**20]))
+                    if not n:
+                        break
+                    filled += n
+                    on_block(n)
+        except (OSError, RuntimeError) as e:
+            raise DecodeError(f"{path}: {e}") from e
+        return audio[:filled]
+
+    def blocks(self, path, blocksize, start=0, stop=None, decimate=1,
+               dtype="float32"):
+        # Whole multiples of decimate keep the kept samples evenly spaced across blocks
+        blocksize = max(decimate, blocksize - blocksize % decimate)
+        try:
+            # Plain reads, sf.blocks() is a lot slower
+            with sf.SoundFile(path) as f:
+                f.seek(start)
+                remaining = (f.frames if stop is None else min(stop, f.frames)) - start
+                while remaining > 0:
+                    block = f.read(min(blocksize, remaining), dtype=dtype,
+                                   always_2d=True)
+                    if not len(block):
+                        break
+                    remaining -= len(block)
+                    yield block_average(block, decimate) if decimate > 1 else block
+        except (OSError, RuntimeError) as e:
+            raise DecodeError(f"{path}: {e}") from e
+
+class FFmpegDecoder:
+    """
+    Anything ffmpeg reads, including the audio track of camera video files,
+    without extracting it to WAV first. Needs ffmpeg and ffprobe on the PATH.
+    ffmpeg seeks to start itself, and decimation resamples inside ffmpeg.
+    """
+    def run(self, args):
+        try:
+            return subprocess.run(args, capture_output=True, check=True).stdout
+        except subprocess.CalledProcessError as e:
+            message = e.stderr.decode(errors="replace").strip() or e
+            raise DecodeError(f"{args[0]} failed on {args[-1]}: {message}") from e
+        except OSError as e:
+            raise DecodeError(f"{args[0]} failed on {args[-1]}: {e}") from e
+
+    def info(self, path):
+        probe = json.loads(self.run([
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=sample_rate,channels,duration:format=duration",
+            "-of", "json", path]))
+        if not probe.get("streams"):
+            raise DecodeError(f"{path}: no audio stream")
+        stream = probe["streams"][0]
+        sample_rate = int(stream["sample_rate"])
+        duration = float(stream.get("duration") or probe["format"]["duration"])
+        return AudioInfo(sample_rate, int(round(duration * sample_rate)),
+                         int(stream["channels"]))
+
+    def blocks(self, path, blocksize, start=0, stop=None, decimate=1,
+               dtype="float32"):
+        info = self.info(path)
+        args = ["ffmpeg", "-v", "error", "-nostdin"]
+        if start:
+            args += ["-ss", f"{start / info.sample_rate:.6f}"]
+        args += ["-i", path, "-map", "0:a:0", "-vn"]
+        if decimate > 1:
+            args += ["-ar", str(info.sample_rate // decimate)]
+        args += ["-f", "f32le", "-acodec", "pcm_f32le", "-"]
+
+        # -t isn't sample accurate, so count the samples instead
+        remaining = None if stop is None else (stop - start) // decimate
+        frame_bytes = 4 * info.channels
+        # stderr goes to a file, a pipe nobody reads could fill up and stall ffmpeg
+        with tempfile.TemporaryFile() as errors:
+            try:
+                process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                           stderr=errors)
+            except OSError as e:
+                raise DecodeError(f"ffmpeg failed on {path}: {e}") from e
+            eof = False
+            try:
+                while remaining is None or remaining > 0:
+                    n = blocksize if remaining is None else min(blocksize, remaining)
+                    data = process.stdout.read(n * frame_bytes)
+                    data = data[:len(data) - len(data) % frame_bytes]
+                    if not data:
+                        eof = True
+                        break
+                    block = np.frombuffer(data, dtype="<f4").reshape(-1, info.channels)
+                    if remaining is not None:
+                        remaining -= len(block)
+                    yield block.astype(dtype)
+            finally:
+                # Stopped early on purpose: ffmpeg is killed, not failed
+                if not eof:
+                    process.kill()
+                process.wait()
+            # ffmpeg stopped by itself. Unless it succeeded, the output is cut short.
+            if eof and process.returncode != 0:
+                errors.seek(0)
+                message = errors.read().decode(errors="replace").strip()
+                raise DecodeError(f"ffmpeg failed on {path} (exit status "
+                                  f"{process.returncode}): {message or 'no error output'}")
+
+    def read(self, path, start=0, stop=None, decimate=1, dtype="float64",
+             on_block=None):
+        blocks = []
+        for block in self.blocks(path, 2**20, start, stop, decimate, dtype):
+            blocks.append(block)
+            if on_block is not None:
+                on_block(len(block) * decimate)
+        if not blocks:
+            return np.zeros((0, 1), dtype=dtype)
+        return np.concatenate(blocks)
+
+DECODERS = {
+    "soundfile": SoundFileDecoder,
+    "ffmpeg": FFmpegDecoder,
+}
+
+def get_decoder(decoder=None):
+    """A decoder backend by name (default: soundfile), or decoder itself if it already is one"""
+    if decoder is None:
+        decoder = "soundfile"
+    if not isinstance(decoder, str):
+        return decoder
+    try:
+        return DECODERS[decoder]()
+    except KeyError:
+        raise ValueError(f"unknown decoder: {decoder} "
+                         f"(choose from {', '.join(DECODERS)})") from None
@@ -1,159 +1,437 @@
+import cProfile
 import os
-import soundfile as sf
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 
 from audio_processing import *
+from audio_io import stream_frame_rms
+from decoders import get_decoder, time_window
+from energy_cache import EnergyCache
+from export import cuts_from_frames, cuts_from_runs, write_timeline
+from pcm_workspace import PCMWorkspace
+from profiling import EditReport
 
 def get_cuts_from_frames(frames):
     """
     Convert a list of camera frames into a list of cuts.
     """
-    if not frames:
-        return []
-
-    cuts = []
-    start_index = 0
-    current_cam = frames[0]
-
-    for i in range(1, len(frames)):
-        if frames[i] != current_cam:
-            duration = i - start_index
-            match current_cam:
-                case Cam.C1:
-                    cam_name = "Close-up 1"
-                case Cam.C2:
-                    cam_name = "Close-up 2"
-                case Cam.WIDE:
-                    cam_name = "Wide"
-            cuts.append((start_index, duration, cam_name))
-            start_index = i
-            current_cam = frames[i]
-
-    # Add the final cut
-    duration = len(frames) - start_index
-    cuts.append((start_index, duration, cam_name))
-    return cuts
+    return [(start, duration, Cam.name(cam))
+            for start, duration, cam in cuts_from_frames(frames)]
+
+def frame_count(stage_output):
+    """Frames in a stage's output: one sequence, or a tuple with one per speaker"""
+    if isinstance(stage_output, tuple):
+        return len(stage_output[0]) if stage_output else 0
+    return len(stage_output)
+
+class EditCancelled(Exception):
+    """Raised from inside an Editor job after cancel() was called"""
 
 class Editor:
     def __init__(self, data):
         self.frame_ms = 30
         self.fps = 30
+        self.export_format = "edl"  # "edl" (one per camera), "merged_edl" or "fcpxml" (one file switching cameras)
+        self.camera_media = None  # {cam: video file} for the FCPXML export (placeholders named after the cameras otherwise)
         self.energy_threshold = 0.015  # Threshold to activate talk mode
         self.dominance_ratio = 2.0  # Audio bleed filtering
 
         self.silence_min_time = 1  # Number of seconds a speaker is silent to end their focus
 
-        self.cam1_min_talk_time = 1  # Number of seconds cam 1 talking has to be to get focus
-        self.cam2_min_talk_time = 0.5  # Number of seconds cam 2 talking has to be to get focus
+        # Number of seconds each speaker's talking has to be to get focus (the last value repeats for extra speakers)
+        self.min_talk_times = [1, 0.5]
 
         self.close_cam_reward = 5
         self.wide_reward = 4
-        self.miss_speaker_penalty = 5
+        self.miss_speaker_penalty = 5  # Per active speaker not in the shot
         self.cut_splits = [15, 35]
         self.cut_penalties = [60, 35, 2]
 
-        self.audio_file1 = None
-        self.audio_file2 = None
+        self.dp_spill_dir = None  # Directory to keep DP backpointers on disk (for very long files)
+        self.dp_low_memory = False  # Checkpoint the DP instead of storing every backpointer
+        self.dp_shard_steps = None  # Solve the DP in parallel time shards of this many steps (None for one pass)
+        self.dp_shard_overlap = 1000  # DP steps each shard overlaps its neighbours by
+        self.dp_verify_shards = False  # Also run the exact DP and report the sharded score gap
+        self.dp_report = None  # Statistics of the last DP run
+
+        self.workers = 2  # Threads for the per-speaker work (1 handles the speakers one by one)
+
+        self.decoder = "soundfile"  # Decoder backend from decoders.DECODERS ("ffmpeg" reads video files directly)
+        self.start_time = None  # Only edit from this many seconds into the recordings (None for the start)
+        self.end_time = None  # ...up to this many seconds (None for the end)
+
+        self.analysis_rate = None  # Decimate to about this many Hz (e.g. 16000) before voice detection (None for full rate)
+
+        self.streaming = False  # Decode block by block instead of loading whole files (long recordings)
+        self.stream_block_frames = 2000  # Audio frames per block when streaming
+
+        # Cache of frame energies, so re-runs on the same files skip decoding (None to disable)
+        self.energy_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "camvad")
+        self.energy_cache_max_mb = 512
+
+        # Decode each track once to a mono scratch file here and memory-map it, instead of
+        # holding the recordings in RAM (very long recordings). Reused across runs.
+        self.pcm_workspace_dir = None
+        self.pcm_workspace_dtype = "float32"  # "int16" halves the disk space
+        self.pcm_workspace_max_gb = 50
+
+        self.audio_files = None  # One decoded recording per speaker
         self.sample_rate = None
+        self.decimation = 1  # audio_files hold every decimation-th sample (low-passed)
+        self.frame_energy = None  # Per-frame RMS of each speaker
+        self.energy_cache_key = None
+        self.audio_version = 0  # Bumped on every load, invalidates stage_memo
+        self.stage_memo = {}  # Stage name -> (input key, output)
 
-        self.cam_frames = None
+        self.cam_segments = None  # The edit: Runs of (start frame, length, camera)
 
-    def load_audio(self, path1, path2):
-        self.audio_file1, sr1 = sf.read(path1)
-        self.audio_file2, sr2 = sf.read(path2)
-        assert sr1 == sr2
-        self.sample_rate = sr1
+        self.trace_memory = False  # Measure each stage's peak memory with tracemalloc (slows process_audio down)
+        self.profile_path = None  # Write cProfile stats of process_audio to this file
+        self.report = None  # EditReport of the current job: per-stage time, memory and DP statistics
 
-    def process_audio(self):
-        # === CONVERT TO MONO, NORMALIZE, AND SYNC ===
-        audio1 = self.audio_file1
-        audio2 = self.audio_file2
-        if audio1.ndim > 1:
-            audio1 = np.mean(audio1, axis=1)
-        if audio2.ndim > 1:
-            audio2 = np.mean(audio2, axis=1)
+        self.progress_callback = None  # Called with (stage name, fraction done) while working
+        self.cancel_requested = False
+
+    def cancel(self):
+        """Ask a running job to stop at its next progress check. Safe to call from another thread."""
+        self.cancel_requested = True
+
+    def report_progress(self, stage, fraction):
+        if self.cancel_requested:
+            raise EditCancelled()
+        if self.progress_callback is not None:
+            self.progress_callback(stage, fraction)
+
+    def block_progress(self, stage, total):
+        """
+        on_block callback for per_track() workers: adds up the samples they
+        report and passes the fraction of total done to report_progress(),
+        so a cancel stops them inside a track instead of after it.
+        """
+        done = 0
+        lock = threading.Lock()
+        def on_block(samples):
+            nonlocal done
+            with lock:
+                done += samples
+                fraction = min(done / max(total, 1), 1)
+            self.report_progress(stage, fraction)
+        return on_block
+
+    def per_track(self, func, *args):
+        """
+        Call func once per speaker track, on a thread pool when workers > 1.
+        args are per-speaker sequences, like map().
+        """
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                return tuple(pool.map(func, *args))
+        return tuple(map(func, *args))
+
+    def min_talk_time(self, speaker):
+        """min_talk_times entry of a speaker, counting from 0"""
+        return self.min_talk_times[min(speaker, len(self.min_talk_times) - 1)]
+
+    def energy_cache(self):
+        if self.energy_cache_dir is None:
+            return None
+        return EnergyCache(self.energy_cache_dir,
+                           self.energy_cache_max_mb * 2**20)
+
+    def pcm_workspace(self):
+        if self.pcm_workspace_dir is None:
+            return None
+        return PCMWorkspace(self.pcm_workspace_dir,
+                            int(self.pcm_workspace_max_gb * 2**30),
+                            self.pcm_workspace_dtype)
 
-        audio1 = normalize_audio(audio1)
-        audio2 = normalize_audio(audio2)
+    def effective_analysis_rate(self):
+        """Rate voice detection runs at: analysis_rate rounded up to a whole decimation of the sample rate"""
+        if self.sample_rate is None:
+            return None
+        if not self.analysis_rate:
+            return self.sample_rate
+        return self.sample_rate // analysis_decimation(self.sample_rate, self.analysis_rate)
 
+    def load_audio(self, *paths):
+        """Load one mic recording per speaker, in speaker order"""
+        self.report = EditReport()
+        with self.report.stage("decode") as record:
+            self.decode_audio(paths)
+            if self.frame_energy is not None:
+                record.frames = len(self.frame_energy[0])
+            record.info["analysis_rate"] = self.effective_analysis_rate()
+
+    def decode_audio(self, paths):
+        self.audio_version += 1
+        self.report_progress("decode", 0)
+        cache = self.energy_cache()
+        self.energy_cache_key = None
+        if cache is not None:
+            pcm_dtype = None
+            if self.pcm_workspace_dir is not None and not self.streaming:
+                pcm_dtype = self.pcm_workspace_dtype
+            self.energy_cache_key = cache.key(paths, self.frame_ms, self.decoder,
+                                              (self.start_time, self.end_time),
+                                              self.analysis_rate, pcm_dtype)
+            cached = cache.load(self.energy_cache_key)
+            if cached is not None:
+                # Nothing to decode, the energies are all process_audio needs
+                self.audio_files = None
+                self.frame_energy, self.sample_rate = cached
+                self.report_progress("decode", 1)
+                return
+
+        if self.streaming:
+            # Only the frame energies are kept, never the full recordings
+            self.audio_files = None
+            self.frame_energy, self.sample_rate = stream_frame_rms(
+                paths, self.frame_ms, self.stream_block_frames,
+                progress=lambda f: self.report_progress("decode", f),
+                workers=self.workers, decoder=self.decoder,
+                start_time=self.start_time, end_time=self.end_time,
+                analysis_rate=self.analysis_rate)
+            self.store_frame_energy()
+            return
+
+        decoder = get_decoder(self.decoder)
+        workspace = self.pcm_workspace()
+        infos = [decoder.info(path) for path in paths]
+        # Only the samples inside the time window are decoded
+        windows = [time_window(info, self.start_time, self.end_time) for info in infos]
+        on_block = self.block_progress("decode", sum(stop - start for start, stop in windows))
+        def decode(path, info, window):
+            start, stop = window
+            if workspace is not None:
+                factor = 1
+                if self.analysis_rate:
+                    factor = analysis_decimation(info.sample_rate, self.analysis_rate)
+                audio = workspace.track(path, decoder, start, stop, factor, on_block)
+            elif self.analysis_rate:
+                # Low-rate float32 analysis copy, decimated while decoding
+                factor = analysis_decimation(info.sample_rate, self.analysis_rate)
+                audio = decoder.read(path, start, stop, factor, dtype="float32",
+                                     on_block=on_block)
+            else:
+                factor = 1
+                audio = decoder.read(path, start, stop, on_block=on_block)
+            return audio, info.sample_rate, factor
+
+        audio = self.per_track(decode, paths, infos, windows)
+        self.report_progress("decode", 1)
+        sample_rates = {sr for _, sr, _ in audio}
+        assert len(sample_rates) == 1
+        self.audio_files = [a for a, _, _ in audio]
+        self.sample_rate = sample_rates.pop()
+        self.decimation = audio[0][2]
+        self.frame_energy = None
+
+    def compute_frame_energy(self):
+        """Per-frame RMS energies of the loaded audio files"""
         # Sync lengths
-        min_len = min(len(audio1), len(audio2))
-        audio1 = audio1[:min_len]
-        audio2 = audio2[:min_len]
+        min_len = min(len(audio) for audio in self.audio_files)
+        # A Fraction when the decimation doesn't divide the frame, see frame_rms()
+        frame_len = Fraction(int(self.sample_rate * self.frame_ms / 1000), self.decimation)
+
+        # Every track is read twice, once for its peak and once for the energies
+        on_block = self.block_progress("energy", sum(len(audio) for audio in self.audio_files)
+                                       + len(self.audio_files) * min_len)
+        def track_energy(audio):
+            # === CONVERT TO MONO, NORMALIZE, AND SYNC ===
+            if audio.ndim > 1:
+                audio = audio[:, 0] if audio.shape[1] == 1 else np.mean(audio, axis=1)
+            # Chunk by chunk, so a memory-mapped track is never loaded whole
+            peak = audio_peak(audio, on_block=on_block)
+            return chunked_frame_rms(audio, min_len, frame_len, peak, on_block=on_block)
+
+        energy = self.per_track(track_energy, self.audio_files)
+        self.report_progress("energy", 1)
+        return energy
+
+    def validate_analysis_rate(self, *paths):
+        """
+        Edit the recordings at full rate and at analysis_rate, and compare the
+        two. Leaves the analysis_rate edit loaded.
+        Returns: report dict with compare_activity() results for the raw and
+                 smoothed activity, the fraction of frames with the same
+                 camera, and the time each energy pass took
+        """
+        analysis_rate = self.analysis_rate
+        cache_dir = self.energy_cache_dir
+        runs = []
+        try:
+            # No cache, both passes have to really compute their energies
+            self.energy_cache_dir = None
+            for rate in (None, analysis_rate):
+                self.analysis_rate = rate
+                self.load_audio(*paths)
+                self.process_audio()
+                seconds = sum(r.wall_s for r in self.report.stages
+                              if r.name in ("decode", "energy"))
+                runs.append((self.stage_memo["activity"][1],
+                             self.stage_memo["smoothing"][1],
+                             self.cam_segments.decode(), seconds))
+        finally:
+            self.analysis_rate = analysis_rate
+            self.energy_cache_dir = cache_dir
 
-        frame_len = int(self.sample_rate * self.frame_ms / 1000)
+        (full_active, full_smooth, full_cams, full_s), (active, smooth, cams, s) = runs
+        n = min(len(full_cams), len(cams))
+        same_cam = np.mean(np.asarray(full_cams[:n]) == np.asarray(cams[:n])) if n else 1.0
+        return {"analysis_rate": analysis_rate,
+                "decimation": analysis_decimation(self.sample_rate, analysis_rate),
+                "effective_rate": self.effective_analysis_rate(),
+                "activity": compare_activity(full_active, active),
+                "smoothed": compare_activity(full_smooth, smooth),
+                "same_camera": float(same_cam),
+                "full_rate_s": round(full_s, 3),
+                "analysis_rate_s": round(s, 3)}
 
-        # === PREPROCESS PASS 1 - Speaker Activity ===
-        speaker1_active, speaker2_active = voice_detect(audio1, audio2,
-                                                        min_len, frame_len,
-                                                        self.energy_threshold,
-                                                        self.dominance_ratio)
+    def store_frame_energy(self):
+        cache = self.energy_cache()
+        if cache is not None:
+            cache.store(self.energy_cache_key, self.frame_energy,
+                        self.sample_rate)
 
-        # === PREPROCESS PASS 2 - Smoothing ===
-        speaker1_active = lookahead_smoothing(speaker1_active, self.silence_min_time)
-        speaker2_active = lookahead_smoothing(speaker2_active, self.silence_min_time)
+    # === PIPELINE STAGES ===
+    # Each stage takes the previous stage's output. STAGES lists the settings
+    # each one reads, so process_audio only reruns a stage when one of its
+    # settings or anything upstream of it changed.
+    def activity_stage(self, frame_energy):
+        return activity_from_energy(frame_energy,
+                                    self.energy_threshold,
+                                    self.dominance_ratio)
 
-        speaker1_active = label_injections(speaker1_active, self.cam1_min_talk_time)
-        speaker2_active = label_injections(speaker2_active, self.cam2_min_talk_time)
+    def smoothing_stage(self, activity):
+        return self.per_track(
+            lambda active: lookahead_smoothing(active, self.silence_min_time),
+            activity)
 
-        # === PROCESSING - Optimal Cutting ===
-        frames = list(zip(speaker1_active, speaker2_active))
+    def injections_stage(self, activity):
+        return self.per_track(label_injections, activity,
+                              [self.min_talk_time(k) for k in range(len(activity))])
+
+    def cutting_stage(self, activity):
+        frames = Runs.encode(np.column_stack(activity))
+        progress = lambda f: self.report_progress("cutting", f)
+        if self.dp_shard_steps:
+            score, _, cf, self.dp_report = dp_edit_sharded(
+                frames,
+                self.close_cam_reward, self.wide_reward, self.miss_speaker_penalty,
+                self.cut_splits, self.cut_penalties,
+                stride=5, max_l=300,
+                shard_steps=self.dp_shard_steps, overlap=self.dp_shard_overlap,
+                verify=self.dp_verify_shards, progress=progress)
+            return cf
+
+        self.dp_report = {}
         score, _, cf = dp_edit(frames,
                                 self.close_cam_reward,
                                 self.wide_reward,
                                 self.miss_speaker_penalty,
                                 self.cut_splits,
                                 self.cut_penalties,
-                                stride=5, max_l=300
+                                stride=5, max_l=300,
+                                spill_dir=self.dp_spill_dir,
+                                low_memory=self.dp_low_memory,
+                                progress=progress,
+                                stats=self.dp_report
         )
-        self.cam_frames = cf
+        return cf
+
+    STAGES = [
+        ("activity", activity_stage, ("energy_threshold", "dominance_ratio")),
+        ("smoothing", smoothing_stage, ("silence_min_time",)),
+        ("injections", injections_stage, ("min_talk_times",)),
+        ("cutting", cutting_stage, ("close_cam_reward", "wide_reward",
+                                    "miss_speaker_penalty",
+                                    "cut_splits", "cut_penalties",
+                                    "dp_shard_steps", "dp_shard_overlap",
+                                    "dp_verify_shards")),
+    ]
+
+    def process_audio(self):
+        if self.report is None or self.report.has("cutting"):
+            self.report = EditReport()
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile() if self.profile_path else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            self.run_stages()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+                self.report.profile_path = self.profile_path
+            if started_tracing:
+                tracemalloc.stop()
+
+    def run_stages(self, until=None):
+        """Run (or reuse) every stage, or just up to and including the stage named until and return its output"""
+        if self.report is None:
+            self.report = EditReport()
+        if self.frame_energy is None:
+            self.report_progress("energy", 0)
+            with self.report.stage("energy") as record:
+                self.frame_energy = self.compute_frame_energy()
+                record.frames = len(self.frame_energy[0])
+            self.store_frame_energy()
+
+        result = self.frame_energy
+        key = self.audio_version
+        for name, stage, settings in self.STAGES:
+            # A stage's key chains its settings onto its upstream stage's key
+            key = (key, tuple(repr(getattr(self, s)) for s in settings))
+            memo = self.stage_memo.get(name)
+            if memo is None or memo[0] != key:
+                self.report_progress(name, 0)
+                with self.report.stage(name) as record:
+                    memo = (key, stage(self, result))
+                    record.frames = frame_count(memo[1])
+                self.stage_memo[name] = memo
+            else:
+                self.report.cached(name, frame_count(memo[1]))
+            result = memo[1]
+            if name == until:
+                return result
+        self.report.dp = self.dp_report
+        self.cam_segments = result
+
+    @property
+    def cam_frames(self):
+        """The camera of every frame, decoded from cam_segments on each access"""
+        return None if self.cam_segments is None else self.cam_segments.decode()
+
+    @cam_frames.setter
+    def cam_frames(self, frames):
+        self.cam_segments = None if frames is None else Runs.encode(np.asarray(frames))
 
     def export_cuts(self, output_dir="."):
         """
-        Export an EDL file for each camera based on the list of cuts.
+        Export the cuts, by default as an EDL file for each camera.
 
         Parameters:
-        - output_dir: Directory to save the EDL files
+        - output_dir: Directory to save the EDL (or FCPXML) files
         """
-        cuts = get_cuts_from_frames(self.cam_frames)
-
-        # Group cuts by camera name
-        cams = {}
-        for start, duration, cam in cuts:
-            cams.setdefault(cam, []).append((start, duration))
-
-        def frames_to_timecode(frame):
-            total_seconds = frame / self.fps
-            hours = int(total_seconds // 3600)
-            minutes = int((total_seconds % 3600) // 60)
-            seconds = int(total_seconds % 60)
-            frames = int(round((total_seconds - int(total_seconds)) * self.fps))
-            return f"{hours:02}:{minutes:02}:{seconds:02}:{frames:02}"
-
-        for cam_name, cam_cuts in cams.items():
-            edl_lines = []
-            edl_lines.append(f"TITLE: Sequence - {cam_name}")
-            edl_lines.append("FCM: NON-DROP FRAME\n")
-
-            for i, (start_frame, duration) in enumerate(cam_cuts, start=1):
-                video_in = frames_to_timecode(start_frame)
-                video_out = frames_to_timecode(start_frame + duration)
-
-                edit_num = f"{i:03}"
-                reel_name = "AX"
-                track = "V"
-                transition = "C"
-
-                edl_lines.append(
-                    f"{edit_num}  {reel_name:<8} {track:<2} {transition:<2}  "
-                    f"{video_in} {video_out} {video_in} {video_out}"
-                )
-                edl_lines.append(f"* FROM CLIP NAME: {cam_name}\n")
-
-            # Write the EDL file for this camera
-            filename = f"Sequence_{cam_name.replace(' ', '_')}.edl"
-            filepath = os.path.join(output_dir, filename)
-            with open(filepath, "w") as f:
-                f.write("\n".join(edl_lines))
+        self.report_progress("export", 0)
+        if self.report is None:
+            self.report = EditReport()
+        with self.report.stage("export") as record:
+            record.frames = len(self.cam_segments)
+            self.write_edls(output_dir)
+        self.report_progress("export", 1)
+
+    def write_edls(self, output_dir):
+        """Write the cuts in self.export_format. Returns the paths written."""
+        # Cuts count from start_time, the EDLs from the start of the recordings
+        offset = int(round((self.start_time or 0) * 1000 / self.frame_ms))
+        return write_timeline(output_dir, cuts_from_runs(self.cam_segments), self.fps,
+                              offset, self.export_format, self.camera_media)
 
 #edittest = Editor(None)
 #edittest.load_audio("./audio_cam1.wav", "./audio_cam2.wav")
@@ -0,0 +1,111 @@
+import hashlib
+import os
+
+import numpy as np
+
+from audio_processing import analysis_decimation
+from decoders import DecodeError, get_decoder
+
+def file_fingerprint(path):
+    """Cheap identity of a file's contents: path, size and modification time"""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+def cache_key(parts):
+    """File name safe key of everything an entry depends on, given as a repr()-able tuple"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def evict_lru(directory, suffix, max_bytes, keep=None):
+    """
+    Delete the least recently used files ending in suffix from directory,
+    except keep, until they fit in max_bytes. Cache hits refresh their
+    file's mtime with os.utime(), so mtime order is use order.
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix) and entry.path != keep:
+            st = entry.stat()
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None:
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # Gone already, or still mapped by another process on Windows
+            pass
+        total -= size
+
+class EnergyCache:
+    """
+    On-disk cache of per-frame RMS energies for sets of speaker recordings.
+    Each entry is one .npz file in cache_dir, evicted by evict_lru() once
+    the entries grow past max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=512 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, paths, frame_ms, decoder=None, window=(None, None),
+            analysis_rate=None, pcm_dtype=None):
+        """
+        Cache key for the energies of a list of files, or None if they can't be read.
+        window: (start_time, end_time) of the analysed part, in seconds
+        analysis_rate: rate the energies were computed at, None for full rate
+        pcm_dtype: sample type of the PCMWorkspace the energies were computed
+                   from, None if the files were decoded in memory
+        """
+        decoder = get_decoder(decoder)
+        try:
+            sample_rates = [decoder.info(path).sample_rate for path in paths]
+            # Backends disagree on the frame count, ffmpeg estimates it from the duration
+            parts = ([file_fingerprint(path) for path in paths], sample_rates,
+                     frame_ms, type(decoder).__name__)
+        except (OSError, DecodeError):
+            return None
+        if window != (None, None):
+            parts += (tuple(window),)
+        if analysis_rate:
+            # ffmpeg resamples where soundfile averages blocks, so the factor
+            # alone doesn't say how the energies were decimated
+            parts += (("decimation", type(decoder).__name__,
+                       [analysis_decimation(sr, analysis_rate) for sr in sample_rates]),)
+        if pcm_dtype is not None:
+            # int16 scratch tracks give slightly different energies
+            parts += (("pcm", np.dtype(pcm_dtype).str),)
+        return cache_key(parts)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """Returns: (tuple of energy arrays, sample_rate), or None on a miss"""
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = (tuple(data["energies"]), int(data["sample_rate"]))
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return entry
+
+    def store(self, key, energies, sample_rate):
+        if key is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, energies=np.asarray(energies),
+                     sample_rate=sample_rate)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        evict_lru(self.cache_dir, ".npz", self.max_bytes)
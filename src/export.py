@@ -0,0 +1,146 @@
+"""
+Timeline exports of an edit: CMX 3600 EDLs and FCPXML.
+
+Everything works from a cut list, [(start_frame, n_frames, cam), ...] in
+timeline order, with integer timecode arithmetic, and is written line by
+line through a buffered file, so even thousands of cuts export in next
+to no time or memory.
+
+Layouts (Editor.export_format):
+    "edl"         one EDL per camera, holding that camera's shots
+    "merged_edl"  one EDL that switches between the cameras
+    "fcpxml"      one FCPXML project that switches between the cameras
+"""
+import os
+from fractions import Fraction
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from audio_processing import Cam, Runs
+
+WRITE_BUFFER = 2**16
+LAYOUTS = ("edl", "merged_edl", "fcpxml")
+
+def cuts_from_frames(cam_frames):
+    """[(start_frame, n_frames, cam), ...] of a per-frame camera sequence"""
+    if not isinstance(cam_frames, np.ndarray):
+        # Quicker than np.asarray() for a long list
+        cam_frames = np.fromiter(cam_frames, dtype=np.int64, count=len(cam_frames))
+    return cuts_from_runs(Runs.encode(cam_frames))
+
+def cuts_from_runs(runs):
+    """[(start_frame, n_frames, cam), ...] of Runs of cameras, e.g. Editor.cam_segments"""
+    return list(zip(runs.starts.tolist(), runs.lengths.tolist(), runs.values.tolist()))
+
+def timecode(frame, fps):
+    """HH:MM:SS:FF non drop frame timecode of a frame count"""
+    seconds, frames = divmod(frame, round(fps))
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}:{frames:02}"
+
+def reel_name(cam):
+    """CMX 3600 reel of a camera: WIDE, CAM1, CAM2, ..., at most 8 characters"""
+    return "WIDE" if cam == Cam.WIDE else f"CAM{cam}"[:8]
+
+def write_edl(path, title, events, fps):
+    """
+    Write a CMX 3600 EDL.
+    events: (start_frame, n_frames, reel name, clip name) in timeline order
+    """
+    track = "V"
+    transition = "C"
+    with open(path, "w", buffering=WRITE_BUFFER) as f:
+        f.write(f"TITLE: {title}\nFCM: NON-DROP FRAME\n")
+        for i, (start, length, reel, clip) in enumerate(events, start=1):
+            video_in = timecode(start, fps)
+            video_out = timecode(start + length, fps)
+            f.write(f"\n{i:03}  {reel:<8} {track:<2} {transition:<2}  "
+                    f"{video_in} {video_out} {video_in} {video_out}\n"
+                    f"* FROM CLIP NAME: {clip}\n")
+
+def frame_duration(fps):
+    """Seconds per frame as a Fraction. NTSC rates (29.97, 59.94, ...) are 1001/30000 etc."""
+    nominal = round(fps)
+    if fps != nominal and abs(fps - nominal * 1000 / 1001) < 1e-3:
+        return Fraction(1001, nominal * 1000)
+    return 1 / Fraction(fps).limit_denominator(1001)
+
+def fcp_time(frames, duration):
+    """FCPXML rational time of a frame count"""
+    t = frames * duration
+    return f"{t.numerator}s" if t.denominator == 1 else f"{t.numerator}/{t.denominator}s"
+
+def write_fcpxml(path, title, cuts, fps, offset=0, media=None):
+    """
+    Write an FCPXML 1.9 project with the cuts on its primary storyline.
+    offset: timeline (and source) frame of the first cut
+    media: {cam: file path} of the camera video. Cameras without one point to
+           a placeholder named after the camera, for relinking in the NLE.
+    """
+    media = media or {}
+    duration = frame_duration(fps)
+    end = offset + (cuts[-1][0] + cuts[-1][1] if cuts else 0)
+    cams = sorted({cam for _, _, cam in cuts})
+    asset_ids = {cam: f"r{k+2}" for k, cam in enumerate(cams)}
+
+    with open(path, "w", buffering=WRITE_BUFFER, encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE fcpxml>\n'
+                '<fcpxml version="1.9">\n  <resources>\n'
+                f'    <format id="r1" frameDuration="{fcp_time(1, duration)}"/>\n')
+        for cam in cams:
+            if cam in media:
+                src = "file://" + quote(os.path.abspath(media[cam]))
+            else:
+                src = quote(Cam.name(cam) + ".mov")
+            f.write(f'    <asset id="{asset_ids[cam]}" name={quoteattr(Cam.name(cam))} '
+                    f'start="0s" duration="{fcp_time(end, duration)}" hasVideo="1" '
+                    f'format="r1" src={quoteattr(src)}/>\n')
+        f.write(f'  </resources>\n  <library>\n    <event name={quoteattr(title)}>\n'
+                f'      <project name={quoteattr(title)}>\n'
+                f'        <sequence format="r1" duration="{fcp_time(end - offset, duration)}" '
+                f'tcStart="{fcp_time(offset, duration)}" tcFormat="NDF">\n'
+                '          <spine>\n')
+        for start, length, cam in cuts:
+            # The cameras run in sync with the timeline, so source time = timeline time
+            at = fcp_time(offset + start, duration)
+            f.write(f'            <asset-clip ref="{asset_ids[cam]}" '
+                    f'name="{escape(Cam.name(cam))}" offset="{at}" start="{at}" '
+                    f'duration="{fcp_time(length, duration)}"/>\n')
+        f.write('          </spine>\n        </sequence>\n      </project>\n'
+                '    </event>\n  </library>\n</fcpxml>\n')
+
+def write_timeline(output_dir, cuts, fps, offset=0, layout="edl", media=None):
+    """
+    Write the cuts in one of LAYOUTS into output_dir.
+    offset: added to every cut's start frame, e.g. where the edited window starts
+    media: {cam: video file}, only used by "fcpxml"
+    Returns: the paths written
+    """
+    if layout == "fcpxml":
+        path = os.path.join(output_dir, "Sequence.fcpxml")
+        write_fcpxml(path, "Sequence", cuts, fps, offset, media)
+        return [path]
+    if layout == "merged_edl":
+        path = os.path.join(output_dir, "Sequence.edl")
+        # Each camera is its own source, so one import sets up every angle
+        write_edl(path, "Sequence", ((start + offset, length, reel_name(cam), Cam.name(cam))
+                                     for start, length, cam in cuts), fps)
+        return [path]
+    if layout != "edl":
+        raise ValueError(f"unknown export format: {layout} (choose from {', '.join(LAYOUTS)})")
+
+    # One EDL per camera, in order of first appearance. Every one has the
+    # same reel, the source is replaced with the camera angle in the NLE.
+    by_cam = {}
+    for start, length, cam in cuts:
+        by_cam.setdefault(cam, []).append((start + offset, length, "AX", Cam.name(cam)))
+    paths = []
+    for cam, events in by_cam.items():
+        cam_name = Cam.name(cam)
+        path = os.path.join(output_dir, f"Sequence_{cam_name.replace(' ', '_')}.edl")
+        write_edl(path, f"Sequence - {cam_name}", events, fps)
+        paths.append(path)
+    return paths
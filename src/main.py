@@ -1,18 +1,49 @@
 import sys
 import webbrowser
 
+from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtSvgWidgets import QSvgWidget
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QStackedWidget,
     QVBoxLayout, QGraphicsDropShadowEffect,
     QHBoxLayout, QPushButton, QSizePolicy,
-    QLabel, QTextBrowser
+    QLabel, QTextBrowser, QProgressBar
 )
 
 from ui_common import HBox, VBox
 from custom_widgets import FileDropButton, TimestampInput
 
-from editor import Editor
+from editor import Editor, EditCancelled
+
+# === Background Editing ===
+class EditWorker(QThread):
+    """Runs a full edit off the GUI thread, reporting progress through signals"""
+    progress = pyqtSignal(str, float)
+    done = pyqtSignal()
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, paths, output_dir="."):
+        super().__init__()
+        self.paths = list(paths)
+        self.output_dir = output_dir
+        self.editor = Editor(None)
+        self.editor.progress_callback = self.progress.emit
+
+    def run(self):
+        try:
+            self.editor.load_audio(*self.paths)
+            self.editor.process_audio()
+            self.editor.export_cuts(self.output_dir)
+        except EditCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.done.emit()
+
+    def cancel(self):
+        self.editor.cancel()
 
 # === Settings ===
 # Landing Page
@@ -90,30 +121,56 @@ class LandingPage(QWidget):
 
 # Audio file selection page
 class FileSelectionPage(QWidget):
+    MAX_SPEAKERS = 8
+
     def __init__(self):
         super().__init__()
-        audio_containers = [HBox(), HBox()]
-        self.buttons = [FileDropButton("Browse or Drop\nAudio Files"),
-                        FileDropButton("Browse or Drop\nAudio Files")]
-        for i, audio_container in enumerate(audio_containers):
-            audio_container.setStyleSheet("QLabel { max-width: 200px; }")
-            audio_container.add_widget(QLabel(f"Mic for Person #{i + 1}"), stretch=1)
-            audio_container.add_widget(self.buttons[i], stretch=1)
-
-        layout_0 = VBox()
+        self.buttons = []
+        self.layout_0 = VBox()
         title = QLabel("Select audio files")
         title.setStyleSheet("QLabel { font-size: 18pt; font-weight: bold;}")
-        layout_0.add_widget(title)
-        for audio_container in audio_containers:
-            layout_0.add_widget(audio_container)
+        self.layout_0.add_widget(title)
+
+        self.add_speaker_button = QPushButton("+ Add Speaker")
+        self.add_speaker_button.setStyleSheet("""
+            QPushButton {
+                background: #222;
+                border: 2px solid #666;
+                border-radius: 5px;
+                padding: 10px;
+                max-width: 200px;
+            }
+            QPushButton:hover {
+                border: 2px solid #ff6600;
+                background: #333;
+            }
+        """)
+        self.add_speaker_button.clicked.connect(self.add_speaker)
+        self.layout_0.add_widget(self.add_speaker_button)
+        for _ in range(2):
+            self.add_speaker()
 
         layout = QHBoxLayout(self)
         layout.addStretch(1)
-        layout.addWidget(layout_0, stretch=16)
+        layout.addWidget(self.layout_0, stretch=16)
         layout.addStretch(1)
 
+    def add_speaker(self):
+        button = FileDropButton("Browse or Drop\nAudio Files")
+        audio_container = HBox()
+        audio_container.setStyleSheet("QLabel { max-width: 200px; }")
+        audio_container.add_widget(QLabel(f"Mic for Person #{len(self.buttons) + 1}"), stretch=1)
+        audio_container.add_widget(button, stretch=1)
+        self.buttons.append(button)
+
+        # Keep the add button below the last speaker
+        self.layout_0.layout.insertWidget(len(self.buttons), audio_container)
+        self.add_speaker_button.setEnabled(len(self.buttons) < self.MAX_SPEAKERS)
+
     def get_filepaths(self):
-        return [button.get_path() for button in self.buttons]
+        paths = [button.get_path() for button in self.buttons]
+        # Extra speakers that were added but left empty are skipped
+        return paths[:2] + [path for path in paths[2:] if path]
 
 # Settings for voice detection
 class VADSettingsPage(QWidget):
@@ -169,7 +226,18 @@ class EditorSettingsPage(QWidget):
 
 # Creation page
 class CreateEditPage(QWidget):
-    def __init__(self, editing_function):
+    # Stage name -> (progress bar start %, end %, status text)
+    STAGES = {
+        "decode": (0, 30, "Decoding audio..."),
+        "energy": (30, 38, "Detecting voices..."),
+        "activity": (38, 40, "Detecting voices..."),
+        "smoothing": (40, 43, "Smoothing speaker activity..."),
+        "injections": (43, 45, "Smoothing speaker activity..."),
+        "cutting": (45, 95, "Choosing cuts..."),
+        "export": (95, 100, "Writing EDL files..."),
+    }
+
+    def __init__(self, editing_function, cancel_function):
         super().__init__()
         self.create = QPushButton("Start Auto-Editing")
         self.create.setStyleSheet("""
@@ -184,22 +252,78 @@ class CreateEditPage(QWidget):
             QPushButton:hover {
                 background-color: #ff8822;
             }
+            QPushButton:disabled {
+                background-color: #555;
+            }
         """)
         self.create.clicked.connect(editing_function)
 
+        self.cancel = QPushButton("Cancel")
+        self.cancel.setStyleSheet("""
+            QPushButton {
+                background: #222;
+                border: 2px solid #666;
+                border-radius: 5px;
+                padding: 10px;
+                max-width: 150px;
+            }
+            QPushButton:hover {
+                border: 2px solid #ff6600;
+                background: #333;
+            }
+        """)
+        self.cancel.clicked.connect(cancel_function)
+
         button_container = HBox()
         button_container.add_stretch(1)
         button_container.add_widget(self.create, stretch=1)
+        button_container.add_widget(self.cancel, stretch=1)
         button_container.add_stretch(1)
 
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.setStyleSheet("""
+            QProgressBar {
+                background: #222;
+                border: 2px solid #444;
+                border-radius: 5px;
+                text-align: center;
+            }
+            QProgressBar::chunk {
+                background-color: #ff6600;
+            }
+        """)
+        self.status = QLabel("")
+
         layout_0 = VBox()
         layout_0.add_widget(button_container)
+        layout_0.add_widget(self.progress)
+        layout_0.add_widget(self.status)
 
         layout = QHBoxLayout(self)
         layout.addStretch(1)
         layout.addWidget(layout_0, stretch=16)
         layout.addStretch(1)
 
+        self.set_running(False)
+
+    def set_running(self, running):
+        self.create.setEnabled(not running)
+        self.cancel.setVisible(running)
+        if running:
+            self.progress.setValue(0)
+            self.status.setText("Starting...")
+
+    def show_progress(self, stage, fraction):
+        start, end, text = self.STAGES.get(stage, (0, 0, ""))
+        self.progress.setValue(max(self.progress.value(),
+                                   int(start + (end - start) * fraction)))
+        self.status.setText(text)
+
+    def show_result(self, text):
+        self.set_running(False)
+        self.status.setText(text)
+
 # === Main Layout ===
 class MainWindow(QWidget):
     def __init__(self):
@@ -265,7 +389,9 @@ class MainWindow(QWidget):
         self.pages.addWidget(self.files)
         self.pages.addWidget(VADSettingsPage())
         self.pages.addWidget(EditorSettingsPage())
-        self.pages.addWidget(CreateEditPage(self.make_edit))
+        self.create_page = CreateEditPage(self.make_edit, self.cancel_edit)
+        self.pages.addWidget(self.create_page)
+        self.worker = None
 
         main_layout.addWidget(self.pages, stretch=5)
 
@@ -311,11 +437,22 @@ class MainWindow(QWidget):
             btn.setChecked(i == index)
 
     def make_edit(self):
-        path1, path2 = self.files.get_filepaths()
-        edit = Editor(None)
-        edit.load_audio(path1, path2)
-        edit.process_audio()
-        edit.export_cuts()
+        if self.worker is not None and self.worker.isRunning():
+            return
+        self.worker = EditWorker(self.files.get_filepaths())
+        self.worker.progress.connect(self.create_page.show_progress)
+        self.worker.done.connect(
+            lambda: self.create_page.show_result("Done! EDL files exported."))
+        self.worker.failed.connect(
+            lambda error: self.create_page.show_result(f"Editing failed: {error}"))
+        self.worker.cancelled.connect(
+            lambda: self.create_page.show_result("Editing cancelled."))
+        self.create_page.set_running(True)
+        self.worker.start()
+
+    def cancel_edit(self):
+        if self.worker is not None:
+            self.worker.cancel()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,234 @@
+"""
+Online editing: camera decisions while the audio is still coming in.
+
+Audio goes in block by block, and every stage runs incrementally. The
+stages are frame energy, voice detection, gap smoothing and the cutting
+DP. A camera is committed a fixed delay after the audio it covers, so
+memory stays the same however long the stream runs.
+"""
+import itertools
+from collections import deque
+
+import numpy as np
+
+from audio_processing import *
+from audio_processing import _dp_layer
+
+class GapFiller:
+    """
+    lookahead_smoothing() for one speaker, one frame at a time. Silent frames
+    are held back until it is known whether their gap gets filled, which is
+    at most lookahead_frames later. Unlike the offline version, a gap at the
+    very start is never filled, since the end of the recording isn't known yet.
+    """
+    def __init__(self, lookahead_frames):
+        self.lookahead = lookahead_frames
+        self.fillable = False  # Inside a gap that follows activity and is still short enough
+        self.gap = 0  # Silent frames held back
+
+    def push(self, active, out):
+        """Append the frames that are decided now to out"""
+        if active:
+            out.extend([1] * (self.gap + 1))
+            self.gap = 0
+            self.fillable = True
+        elif self.fillable and self.gap + 1 < self.lookahead:
+            self.gap += 1
+        else:
+            out.extend([0] * (self.gap + 1))
+            self.gap = 0
+            self.fillable = False
+
+    def finish(self, out):
+        # A gap at the end is never filled
+        out.extend([0] * self.gap)
+        self.gap = 0
+
+class FixedLagDP:
+    """
+    The dp_edit recursion one step at a time (fixed-lag Viterbi). Once step t
+    is in, the camera of step t - lag is committed: it is where the best path
+    so far passes, and every path that doesn't pass there is dropped, so the
+    commits always join up into one valid edit. With lag >= the number of
+    steps this is exactly dp_edit's path; smaller lags trade optimality for
+    latency. lag must be at least 1. Memory is O(lag * cams * l states).
+    """
+    def __init__(self, n_cams, penalties, lag):
+        self.penalties = penalties
+        self.lag = lag
+        shape = (n_cams, len(penalties))
+        self.layer = None
+        self.spare = np.empty(shape)
+        # Ring buffer of the backpointers of the uncommitted steps
+        self.back_cam = np.zeros((lag,) + shape, dtype=np.int8)
+        self.back_l = np.zeros((lag,) + shape, dtype=np.int16)
+        self.steps = 0
+        self.committed = 0
+
+    def step(self, scores):
+        """Add one step's camera scores. Returns the committed camera index, if any."""
+        if self.layer is None:
+            self.layer = np.full(self.spare.shape, -np.inf)
+            self.layer[:, 0] = scores
+        else:
+            slot = self.steps % len(self.back_cam)
+            _dp_layer(self.layer, self.spare, scores, self.penalties,
+                      self.back_cam[slot], self.back_l[slot])
+            self.layer, self.spare = self.spare, self.layer
+        self.steps += 1
+
+        if self.steps - self.committed <= self.lag:
+            return None
+        # Where every state's path was at the step being committed
+        cam, l = np.indices(self.layer.shape)
+        for t in range(self.steps - 1, self.committed, -1):
+            slot = t % len(self.back_cam)
+            cam, l = self.back_cam[slot][cam, l], self.back_l[slot][cam, l]
+        best = np.unravel_index(np.argmax(self.layer), self.layer.shape)
+        keep = (cam == cam[best]) & (l == l[best])
+        self.layer[~keep] = -np.inf
+        self.committed += 1
+        return int(cam[best])
+
+    def finish(self):
+        """Camera indices of the uncommitted steps, along the best path"""
+        if self.committed == self.steps:
+            return []
+        ci, l = np.unravel_index(np.argmax(self.layer), self.layer.shape)
+        path = [int(ci)]
+        for t in range(self.steps - 1, self.committed, -1):
+            slot = t % len(self.back_cam)
+            ci, l = self.back_cam[slot, ci, l], self.back_l[slot, ci, l]
+            path.append(int(ci))
+        self.committed = self.steps
+        path.reverse()
+        return path
+
+class OnlineEditor:
+    """
+    Incremental version of Editor.process_audio(), using the editor's settings.
+    Feed (samples, speakers) blocks to push() and collect the camera decisions.
+
+    latency: seconds the DP waits before committing a camera. Longer is
+             closer to the offline edit, 0 cuts almost greedily. Smoothing adds up
+             to silence_min_time on top, see delay().
+    start_peak: the audio is normalized by the loudest sample so far, but
+                never by less than this, so a quiet start isn't blown up
+
+    Talking bursts aren't labeled as injections: dp_edit scores them the
+    same as any other talking, so the cuts don't change.
+    """
+    def __init__(self, editor, n_speakers, sample_rate, latency=5.0,
+                 stride=5, max_l=300, start_peak=0.5):
+        self.editor = editor
+        self.stride = stride
+        self.frame_len = int(sample_rate * editor.frame_ms / 1000)
+        self.peak = np.full(n_speakers, start_peak, dtype=np.float32)
+        self.pending = np.zeros((0, n_speakers), dtype=np.float32)  # Samples of a partial frame
+
+        self.lookahead = int(editor.silence_min_time * 1000 / FRAME_MS)
+        self.fillers = [GapFiller(self.lookahead) for _ in range(n_speakers)]
+        self.smoothed = [deque() for _ in range(n_speakers)]
+
+        self.cams = Cam.all(n_speakers)
+        self.table = score_table(n_speakers, self.cams, editor.close_cam_reward,
+                                 editor.wide_reward, editor.miss_speaker_penalty)
+        # A step's frames all have to be in before its camera is committed
+        self.lag = max(1, int(latency * 1000 / (stride * editor.frame_ms)))
+        self.dp = FixedLagDP(len(self.cams),
+                             cut_penalty_table(max_l, editor.cut_splits,
+                                               editor.cut_penalties),
+                             self.lag)
+        self.frames = 0  # Smoothed frames seen by the DP
+        self.decided = 0  # Frames with a committed camera
+
+    def delay(self):
+        """Worst case seconds between audio arriving and its camera being committed"""
+        frames = self.lookahead + (self.lag + 1) * self.stride
+        return frames * self.editor.frame_ms / 1000
+
+    def push(self, block):
+        """
+        Add a (samples, speakers) block of mono audio.
+        Returns: [(start_frame, n_frames, cam), ...] for the newly committed frames
+        """
+        block = np.concatenate((self.pending, block))
+        n_full = len(block) // self.frame_len
+        self.pending = block[n_full * self.frame_len:]
+        return self.analyse(block[:n_full * self.frame_len])
+
+    def stream(self, blocks):
+        """
+        push() every (samples, speakers) block, then finish().
+        Yields: (start_frame, n_frames, cam) decisions as they are committed
+        """
+        for block in blocks:
+            yield from self.push(block)
+        yield from self.finish()
+
+    def finish(self):
+        """End of the stream. Returns the decisions for all remaining frames."""
+        decisions = self.analyse(self.pending)
+        self.pending = self.pending[:0]
+        for filler, out in zip(self.fillers, self.smoothed):
+            filler.finish(out)
+        decisions += self.advance()
+        for ci in self.dp.finish():
+            self.decide(ci, decisions)
+        # The last step may cover less than a full stride
+        if decisions and self.decided > self.frames:
+            start, length, cam = decisions[-1]
+            decisions[-1] = (start, length - (self.decided - self.frames), cam)
+            self.decided = self.frames
+        return decisions
+
+    def analyse(self, block):
+        if not len(block):
+            return []
+        self.peak = np.maximum(self.peak, np.max(np.abs(block), axis=0))
+        energies = [frame_rms(block[:, k] / self.peak[k], len(block), self.frame_len)
+                    for k in range(block.shape[1])]
+        activity = activity_from_energy(energies, self.editor.energy_threshold,
+                                        self.editor.dominance_ratio)
+        for filler, out, active in zip(self.fillers, self.smoothed, activity):
+            for a in active:
+                filler.push(a, out)
+        return self.advance()
+
+    def advance(self):
+        """Run the DP over the frames every speaker's smoothing has decided"""
+        decisions = []
+        for _ in range(min(len(out) for out in self.smoothed)):
+            pattern = 0
+            for k, out in enumerate(self.smoothed):
+                pattern |= out.popleft() << k
+            if self.frames % self.stride == 0:
+                ci = self.dp.step(self.table[pattern])
+                if ci is not None:
+                    self.decide(ci, decisions)
+            self.frames += 1
+        return decisions
+
+    def decide(self, ci, decisions):
+        """Commit one DP step's camera, merging it into the last decision if it's the same"""
+        n = self.stride
+        cam = self.cams[ci]
+        if decisions and decisions[-1][2] == cam:
+            start, length, _ = decisions[-1]
+            decisions[-1] = (start, length + n, cam)
+        else:
+            decisions.append((self.decided, n, cam))
+        self.decided += n
+
+def edit_stream(editor, blocks, sample_rate, **options):
+    """
+    Run an OnlineEditor over an iterable of (samples, speakers) blocks,
+    e.g. from audio_io.file_blocks() or audio_io.pcm_blocks().
+    Yields: (start_frame, n_frames, cam) decisions as they are committed
+    """
+    blocks = iter(blocks)
+    first = next(blocks, None)
+    if first is None:
+        return
+    online = OnlineEditor(editor, first.shape[1], sample_rate, **options)
+    yield from online.stream(itertools.chain([first], blocks))
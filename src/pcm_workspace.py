@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+import numpy as np
+
+from energy_cache import cache_key, evict_lru, file_fingerprint
+
+class PCMWorkspace:
+    """
+    Scratch files of decoded recordings, for recordings too long to hold in
+    memory. Each track is decoded once to mono float32 (or int16) raw PCM
+    in workspace_dir and then memory-mapped, so the OS page cache holds the
+    working set instead of the process. Tracks are keyed by the file, the
+    decoder, the sample window and the decimation, so later runs on the same
+    files reuse them, and evict_lru() keeps the tracks within max_bytes.
+    """
+    def __init__(self, workspace_dir, max_bytes=50 * 2**30, dtype="float32",
+                 blocksize=2**20):
+        if np.dtype(dtype) not in (np.float32, np.int16):
+            raise ValueError(f"PCM workspace dtype must be float32 or int16, not {dtype}")
+        self.workspace_dir = workspace_dir
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.blocksize = blocksize
+
+    def key(self, path, decoder, start=0, stop=None, decimate=1):
+        parts = (file_fingerprint(path), type(decoder).__name__, start, stop,
+                 decimate, self.dtype.str)
+        return cache_key(parts)
+
+    def _path(self, key):
+        return os.path.join(self.workspace_dir, f"{key}.{self.dtype.name}.pcm")
+
+    def track(self, path, decoder, start=0, stop=None, decimate=1, on_block=None):
+        """
+        Mono samples start:stop of a file (decimated like decoder.blocks()),
+        decoding it into the workspace first if it isn't there yet.
+        on_block: called with the number of file samples in each block decoded.
+                  It may raise to abort, and then nothing is kept.
+        Returns: read only np.memmap
+        """
+        scratch = self._path(self.key(path, decoder, start, stop, decimate))
+        if os.path.exists(scratch):
+            os.utime(scratch)
+        else:
+            self.decode(path, decoder, start, stop, decimate, scratch, on_block)
+            self.evict(keep=scratch)
+        if os.path.getsize(scratch) == 0:
+            # np.memmap can't map an empty file
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(scratch, dtype=self.dtype, mode="r")
+
+    def decode(self, path, decoder, start, stop, decimate, scratch, on_block=None):
+        os.makedirs(self.workspace_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.workspace_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in decoder.blocks(path, self.blocksize, start, stop,
+                                            decimate, dtype="float32"):
+                    mono = block[:, 0] if block.shape[1] == 1 else np.mean(block, axis=1)
+                    if self.dtype == np.int16:
+                        mono = np.clip(np.round(mono * 32767), -32768, 32767)
+                    f.write(mono.astype(self.dtype).tobytes())
+                    if on_block is not None:
+                        on_block(len(block) * decimate)
+            os.replace(tmp_path, scratch)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def evict(self, keep=None):
+        evict_lru(self.workspace_dir, ".pcm", self.max_bytes, keep)
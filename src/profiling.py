@@ -0,0 +1,124 @@
+"""
+Instrumentation for Editor jobs: where the time and memory of an edit go.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def max_rss_mb():
+    """Peak resident memory of this process so far, or None where unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 2)
+
+class StageRecord:
+    def __init__(self, name, start_s):
+        self.name = name
+        self.start_s = start_s  # Since the report was created
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak_mb = None  # Peak traced memory above the stage's starting point (tracemalloc only)
+        self.max_rss_mb = None  # Process memory high-water mark after the stage
+        self.frames = None
+        self.cached = False  # Output came from the stage memo
+        self.info = {}
+
+    def to_dict(self):
+        record = {"name": self.name, "start_s": round(self.start_s, 6),
+                  "wall_s": round(self.wall_s, 6), "cpu_s": round(self.cpu_s, 6),
+                  "peak_mb": self.peak_mb, "max_rss_mb": self.max_rss_mb,
+                  "frames": self.frames, "cached": self.cached}
+        record.update(self.info)
+        return record
+
+class EditReport:
+    """
+    Per-stage timings of an Editor job, in the order the stages ran.
+    Memory peaks are only measured while tracemalloc is tracing.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = []
+        self.dp = None  # DP statistics of the cutting stage
+        self.profile_path = None  # cProfile stats file, if one was written
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a with block as one stage. Yields its StageRecord."""
+        record = StageRecord(name, time.perf_counter() - self.origin)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_s = time.perf_counter() - self.origin - record.start_s
+            record.cpu_s = time.process_time() - cpu
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                record.peak_mb = round(peak / 2**20, 2)
+            record.max_rss_mb = max_rss_mb()
+            self.stages.append(record)
+
+    def cached(self, name, frames=None):
+        """Record a stage that was skipped because its output was memoized"""
+        record = StageRecord(name, time.perf_counter() - self.origin)
+        record.cached = True
+        record.frames = frames
+        self.stages.append(record)
+
+    def has(self, name):
+        return any(record.name == name for record in self.stages)
+
+    def total_s(self):
+        return sum(record.wall_s for record in self.stages)
+
+    def to_dict(self):
+        return {"total_s": round(self.total_s(), 6),
+                "stages": [record.to_dict() for record in self.stages],
+                "dp": self.dp, "profile_path": self.profile_path}
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        """Write the stages as a trace for chrome://tracing or Perfetto"""
+        events = []
+        for record in self.stages:
+            args = {key: value for key, value in record.to_dict().items()
+                    if key not in ("name", "start_s", "wall_s") and value is not None}
+            if record.name == "cutting" and self.dp:
+                args["dp"] = self.dp
+            events.append({"name": record.name, "cat": "camvad", "ph": "X",
+                           "ts": record.start_s * 1e6, "dur": record.wall_s * 1e6,
+                           "pid": os.getpid(), "tid": 1, "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """One line per stage, for printing"""
+        lines = []
+        for record in self.stages:
+            if record.cached:
+                lines.append(f"{record.name:<12} cached")
+                continue
+            line = f"{record.name:<12} {record.wall_s:8.3f}s wall {record.cpu_s:8.3f}s cpu"
+            if record.peak_mb is not None:
+                line += f" {record.peak_mb:8.1f}MB peak"
+            if record.frames is not None:
+                line += f" {record.frames} frames"
+            lines.append(line)
+        return lines
@@ -0,0 +1,143 @@
+"""
+Parameter sweeps over the editing style settings.
+
+Voice detection runs once per distinct set of detection settings (decoding
+and frame energies only once in total). The configs' cutting DPs then run
+in batches (dp_edit_batch) in a process pool, and each result is
+summarized as a few metrics to compare configs by. Every config is cut
+exactly, so the DP sharding settings make no difference here.
+"""
+import itertools
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_processing import Cam, Runs, dp_edit_batch
+from editor import Editor
+
+CUTTING_SETTINGS = Editor.STAGES[-1][2]
+# Settings a sweep can vary: the ones the pipeline stages after decoding read
+STAGE_SETTINGS = tuple(name for _, _, settings in Editor.STAGES for name in settings)
+# Settings of a dp_edit_batch() config, in order
+WEIGHTS = ("close_cam_reward", "wide_reward", "miss_speaker_penalty",
+           "cut_splits", "cut_penalties")
+
+def grid_configs(space):
+    """Every combination of space {setting: [values, ...]}"""
+    names = list(space)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(space[name] for name in names))]
+
+def random_configs(space, n, seed=0):
+    """
+    n random configs. A setting's values are either a list to pick from
+    or a (low, high) tuple to draw uniformly from (integers if both are).
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = rng.randint(low, high)
+                else:
+                    config[name] = rng.uniform(low, high)
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+def edit_metrics(segments, activity, frame_ms, score=None):
+    """
+    Summary of an edit.
+    segments: Runs of the camera, as dp_edit() returns them
+    activity: the per-speaker activity the cuts were made from
+    """
+    cams = segments.decode()
+    n = len(cams)
+    cuts = int(np.count_nonzero(segments.values[1:] != segments.values[:-1]))
+    active = np.column_stack(activity)[:n] != 0
+
+    # Active speakers not in the shot: the wide shot shows everyone
+    shown = np.zeros_like(active)
+    for k in range(active.shape[1]):
+        shown[:, k] = (cams == Cam.WIDE) | (cams == Cam.closeup(k))
+    return {"score": score,
+            "cuts": cuts,
+            "mean_shot_s": round(n * frame_ms / 1000 / (cuts + 1), 3) if n else 0,
+            "wide_ratio": round(float(np.mean(cams == Cam.WIDE)), 4) if n else 0,
+            "miss_frames": int(np.count_nonzero(active & ~shown))}
+
+def evaluate(activity_runs, weights, frame_ms):
+    """Cut a batch of weight configs together. Runs in a worker process."""
+    # Activity travels run-length encoded, it is much smaller that way
+    activity = tuple(activity_runs.decode().T)
+    return [edit_metrics(segments, activity, frame_ms, score)
+            for score, _, segments in dp_edit_batch(activity_runs, weights)]
+
+def sweep(editor, configs, workers=None, progress=None, batch_size=16):
+    """
+    Evaluate configs of Editor settings on the audio loaded into editor.
+    Settings a config leaves out keep the editor's values. Configs may only
+    vary STAGE_SETTINGS: the audio is already decoded, so decoding and frame
+    energy settings (start_time, analysis_rate, ...) can't change per config.
+    progress: called with the fraction of configs done
+    batch_size: most configs cut together in one DP pass
+    Returns: [{"settings": config, "metrics": edit_metrics()}, ...] in config order
+    """
+    for config in configs:
+        for name in config:
+            if name not in STAGE_SETTINGS:
+                raise ValueError(f"a sweep can't vary {name}, only the stage settings: "
+                                 f"{', '.join(STAGE_SETTINGS)}. Set it on the editor (--set) to change it for every config.")
+    workers = workers or os.cpu_count() or 1
+    # Group configs by everything upstream of the cutting stage
+    upstream = {}
+    base = {name: getattr(editor, name) for name in CUTTING_SETTINGS}
+    for index, config in enumerate(configs):
+        detection = tuple(sorted((name, repr(value)) for name, value in config.items()
+                                 if name not in CUTTING_SETTINGS))
+        upstream.setdefault(detection, []).append(index)
+
+    results = [None] * len(configs)
+    saved = {name: getattr(editor, name) for config in configs for name in config}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for indices in upstream.values():
+                for name, value in configs[indices[0]].items():
+                    if name not in CUTTING_SETTINGS:
+                        setattr(editor, name, value)
+                activity = editor.run_stages(until=Editor.STAGES[-2][0])
+                activity_runs = Runs.encode(np.column_stack(activity))
+
+                # Big batches amortize the DP's per-step work, but every worker needs one
+                size = min(batch_size, math.ceil(len(indices) / workers))
+                for start in range(0, len(indices), size):
+                    batch = indices[start:start + size]
+                    weights = []
+                    for index in batch:
+                        settings = dict(base, **{name: value for name, value in configs[index].items()
+                                                 if name in CUTTING_SETTINGS})
+                        weights.append(tuple(settings[name] for name in WEIGHTS))
+                    future = pool.submit(evaluate, activity_runs, weights, editor.frame_ms)
+                    futures[future] = batch
+                for name, value in saved.items():
+                    setattr(editor, name, value)
+
+            done = 0
+            for future, batch in futures.items():
+                for index, metrics in zip(batch, future.result()):
+                    results[index] = {"settings": configs[index], "metrics": metrics}
+                done += len(batch)
+                if progress is not None:
+                    progress(done / len(configs))
+    finally:
+        for name, value in saved.items():
+            setattr(editor, name, value)
+    return results
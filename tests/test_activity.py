@@ -0,0 +1,143 @@
+"""
+Voice activity stages against the plain per-frame loops they replaced.
+"""
+import numpy as np
+import pytest
+
+from audio_processing import (FRAME_MS, Runs, activity_from_energy, frame_rms,
+                              label_injections, lookahead_smoothing, voice_detect)
+
+def reference_voice_detect(speaker1_audio, speaker2_audio, min_len, frame_len,
+                           threshold, dominance):
+    """The original voice_detect(): one rms() and one decision per frame"""
+    def rms(frame):
+        return np.sqrt(np.mean(np.square(frame)) + 1e-9)
+
+    energies = ([], [])
+    activity = ([], [])
+    for i in range(0, min_len, frame_len):
+        e1 = rms(speaker1_audio[i:i + frame_len])
+        e2 = rms(speaker2_audio[i:i + frame_len])
+        s1 = s2 = 0
+        if e1 > threshold or e2 > threshold:
+            if e1 > e2 * dominance:
+                s1 = 1
+            elif e2 > e1 * dominance:
+                s2 = 1
+            else:
+                s1 = s2 = 1
+        for k, (e, s) in enumerate(((e1, s1), (e2, s2))):
+            energies[k].append(e)
+            activity[k].append(s)
+    return energies, activity
+
+def reference_lookahead_smoothing(activity, lookahead_time):
+    """The original lookahead_smoothing(), frame by frame. smoothed[i-1] carries filled frames on."""
+    lookahead_time = int(lookahead_time * 1000 / FRAME_MS)
+    smoothed = activity.copy()
+    length = len(activity)
+    for i in range(length):
+        if activity[i] == 0 and smoothed[i-1] != 0:
+            end = min(i + lookahead_time, length)
+            if np.any(activity[i+1:end]):
+                smoothed[i] = 1
+    return smoothed
+
+def reference_label_injections(speaker_activity, min_talk_time_sec):
+    """The original label_injections(), walking each burst with a nested while"""
+    min_talk_frames = int(min_talk_time_sec * 1000 / FRAME_MS)
+    labeled = speaker_activity.copy()
+    length = len(speaker_activity)
+    i = 0
+    while i < length:
+        if speaker_activity[i] == 1:
+            start = i
+            while i < length and speaker_activity[i] == 1:
+                i += 1
+            if i - start < min_talk_frames:
+                for j in range(start, i):
+                    labeled[j] = 0.5
+        else:
+            i += 1
+    return labeled
+
+def random_activity(n, seed):
+    """0/1 activity in runs of 1 to 12 frames"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 13, n)
+    values = (rng.integers(0, 2) + np.arange(n)) % 2
+    return np.repeat(values, lengths)[:n]
+
+def random_speakers(n_frames, frame_len, seed):
+    """
+    Two tracks of frames that are silent, quiet or loud, sometimes the very
+    same frame on both tracks for an exact tie. Samples are multiples of 1/8
+    and frame_len a power of two, so every energy is computed exactly.
+    """
+    rng = np.random.default_rng(seed)
+    tracks = np.zeros((2, n_frames * frame_len))
+    for t in range(n_frames):
+        frame = slice(t * frame_len, (t+1) * frame_len)
+        for k in range(2):
+            level = rng.choice([0, 1, 4])
+            tracks[k, frame] = rng.integers(-level, level + 1, frame_len) / 8
+        if rng.random() < 0.2:
+            tracks[1, frame] = tracks[0, frame]
+    return tracks
+
+@pytest.mark.parametrize("dominance", [0.5, 1, 1.5, 3])
+@pytest.mark.parametrize("frame_len", [1, 16])
+def test_voice_detect(dominance, frame_len):
+    for seed in range(4):
+        tracks = random_speakers(300, frame_len, seed)
+        # Every min_len from whole frames to a partial tail frame
+        for min_len in (tracks.shape[1], tracks.shape[1] - 1, tracks.shape[1] - frame_len // 2,
+                        frame_len // 2 + 1):
+            energies, activity = reference_voice_detect(*tracks, min_len, frame_len,
+                                                        0.2, dominance)
+            for k in range(2):
+                assert frame_rms(tracks[k], min_len, frame_len).tolist() == energies[k]
+            assert [a.tolist() for a in activity_from_energy(energies, 0.2, dominance)] == \
+                list(activity)
+            assert [a.tolist() for a in voice_detect(tracks, min_len, frame_len, 0.2, dominance)] == \
+                list(activity)
+
+def test_frame_rms_tail_reads_past_min_len():
+    # Like the rms() loop, the partial last frame takes a whole frame_len of samples
+    audio = np.arange(10, dtype=float)
+    assert frame_rms(audio, 5, 4).tolist() == [np.sqrt(np.mean(np.square(audio[i:i + 4])) + 1e-9)
+                                               for i in (0, 4)]
+
+@pytest.mark.parametrize("frames", [0, 1, 2, 3, 5, 12])
+def test_lookahead_smoothing(frames):
+    lookahead_time = frames * FRAME_MS / 1000
+    cases = [random_activity(n, seed) for seed in range(20) for n in (1, 2, 7, 60)]
+    # Start and end gaps, with the recording ending active and not
+    cases += [np.array(a) for a in ([0, 0, 1, 1, 0, 1], [0, 0, 1, 1, 0, 0], [0, 1, 0, 0, 1],
+                                    [1, 0, 0, 0], [0, 0, 0], [1, 1], [], [0, 1, 0, 1, 0])]
+    for activity in cases:
+        assert lookahead_smoothing(activity, lookahead_time).tolist() == \
+            reference_lookahead_smoothing(activity, lookahead_time).tolist()
+
+@pytest.mark.parametrize("frames", [0, 1, 2, 4, 13])
+def test_label_injections(frames):
+    min_talk_time = frames * FRAME_MS / 1000
+    cases = [random_activity(n, seed) for seed in range(20) for n in (1, 2, 7, 60)]
+    cases += [[], [1], [0], [1, 1, 1, 1], [0, 1, 0, 1, 1, 0]]
+    for activity in cases:
+        assert label_injections(activity, min_talk_time).tolist() == \
+            reference_label_injections(np.array(activity, dtype=float), min_talk_time).tolist()
+
+@pytest.mark.parametrize("seq", [
+    np.zeros(0), np.zeros((0, 2)),
+    np.array([1]), np.array([[0, 1]]), np.array([[0, 1, 1]]),
+    np.array([1, 1, 0, 0, 0, 1]), np.array([[1, 0], [1, 0], [1, 1], [0, 0]]),
+])
+def test_runs_encode(seq):
+    runs = Runs.encode(seq)
+    assert len(runs) == len(seq)
+    assert runs.decode().shape == seq.shape
+    assert np.array_equal(runs.decode(), seq)
+    assert [np.asarray(v).tolist() for v in runs] == seq.tolist()
+    # Runs are maximal: neighbours always differ
+    assert all(np.any(a != b) for a, b in zip(runs.values[1:], runs.values[:-1]))
@@ -0,0 +1,157 @@
+"""
+dp_edit() and its variants against the plain triple loop DP they replaced,
+on random activity with runs and ties, down to the exact score and sequence.
+"""
+import random
+
+import pytest
+
+from audio_processing import (Cam, Runs, cut_penalty, cut_penalty_table, dp_edit,
+                              dp_edit_batch, score_frame)
+
+CONFIGS = [
+    # close_cam_reward, wide_reward, miss_speaker_penalty, cut_splits, cut_penalties, stride, max_l
+    (5, 4, 5, [15, 35], [60, 35, 2], 5, 300),
+    (5, 4, 5, [15, 35], [60, 35, 2], 1, 40),
+    (5, 4, -3, [6, 20], [30, 20, 1], 2, 25),
+    (3, 3, 3, [2], [1, 1], 2, 5),
+    (5, 4, 5, [15, 35], [60, 35, 2], 3, 1),
+    (1.1, 0.7, 0.3, [3, 9], [2.2, 1.3, 0.1], 1, 12),
+]
+
+def reference_dp(frames, close_cam_reward, wide_reward, miss_speaker_penalty,
+                 cut_splits, cut_penalties, stride, max_l):
+    """The original DP: every (cam, l) state from every (cam, l) state, one step at a time"""
+    frames_ds = frames[::stride]
+    cams = Cam.all(len(frames_ds[0]))
+    n = len(frames_ds)
+    back = [[[None] * (max_l+1) for _ in cams] for _ in range(n)]
+    prev_dp = [[-float("inf")] * (max_l+1) for _ in cams]
+    for ci, cam in enumerate(cams):
+        prev_dp[ci][0] = score_frame(cam, frames_ds[0], close_cam_reward,
+                                     wide_reward, miss_speaker_penalty)
+
+    for t in range(1, n):
+        frame_score = [score_frame(cam, frames_ds[t], close_cam_reward,
+                                   wide_reward, miss_speaker_penalty) for cam in cams]
+        curr_dp = [[-float("inf")] * (max_l+1) for _ in cams]
+        for ci in range(len(cams)):
+            for pj in range(len(cams)):
+                for l_prev, prev_score in enumerate(prev_dp[pj]):
+                    if prev_score == -float("inf"):
+                        continue
+                    if ci == pj:
+                        l_new = min(l_prev+1, max_l)
+                        cand = prev_score + frame_score[ci]
+                    else:
+                        l_new = 0
+                        cand = (prev_score + frame_score[ci]
+                                - cut_penalty(l_prev, cut_splits, cut_penalties))
+                    if cand > curr_dp[ci][l_new]:
+                        curr_dp[ci][l_new] = cand
+                        back[t][ci][l_new] = (pj, l_prev)
+        prev_dp = curr_dp
+
+    best_val, state = -float("inf"), None
+    for ci in range(len(cams)):
+        for l in range(max_l+1):
+            if prev_dp[ci][l] > best_val:
+                best_val, state = prev_dp[ci][l], (ci, l)
+
+    seq = []
+    for t in range(n-1, -1, -1):
+        seq.append(cams[state[0]])
+        state = back[t][state[0]][state[1]]
+    seq.reverse()
+    expanded = [cam for cam in seq for _ in range(stride)][:len(frames)]
+    return best_val, seq, expanded
+
+def random_frames(n, n_speakers, seed):
+    """Speaker activity in runs, with long shared silences and crosstalk"""
+    rng = random.Random(seed)
+    active = [0] * n_speakers
+    frames = []
+    for _ in range(n):
+        for k in range(n_speakers):
+            if rng.random() < 0.05:
+                active[k] = rng.choice([0, 0, 1])
+        frames.append(tuple(active))
+    return frames
+
+def cases():
+    for seed in range(6):
+        n = random.Random(seed).randint(1, 400)
+        for n_speakers in (2, 3):
+            yield random_frames(n, n_speakers, seed)
+    # Shorter than a stride, and a single frame
+    yield random_frames(3, 2, 100)
+    yield random_frames(1, 3, 101)
+
+@pytest.fixture(scope="module")
+def expected():
+    """{(case, config): reference_dp() result}, computed once for every test"""
+    return {(k, c): reference_dp(frames, *config)
+            for k, frames in enumerate(cases())
+            for c, config in enumerate(CONFIGS)}
+
+def check(result, reference):
+    score, seq, segments = result
+    assert score == reference[0]
+    assert seq == reference[1]
+    assert list(segments) == reference[2]
+
+def check_all(expected, convert=None, **kwargs):
+    """dp_edit(frames, ..., **kwargs) on every case and config against reference_dp()"""
+    for k, frames in enumerate(cases()):
+        if convert is not None:
+            frames = convert(frames)
+        for c, config in enumerate(CONFIGS):
+            *weights, stride, max_l = config
+            check(dp_edit(frames, *weights, stride=stride, max_l=max_l, **kwargs),
+                  expected[k, c])
+
+def test_dp_edit(expected):
+    check_all(expected)
+
+def test_spill_dir(expected, tmp_path):
+    # Backpointers in np.memmap files instead of memory
+    check_all(expected, spill_dir=tmp_path)
+
+def test_low_memory(expected):
+    # Checkpointed layers, backpointers recomputed segment by segment
+    check_all(expected, low_memory=True)
+
+def test_runs_input(expected):
+    # The DP advances over whole runs of identical frames
+    check_all(expected, convert=Runs.encode)
+
+def test_dp_edit_batch():
+    # Configs with different cut splits, so different pruned penalty tables, in one batch
+    configs = [config[:5] for config in CONFIGS]
+    for frames in cases():
+        results = dp_edit_batch(frames, configs, stride=2, max_l=40)
+        assert len(results) == len(configs)
+        for config, result in zip(configs, results):
+            check(result, reference_dp(frames, *config, 2, 40))
+
+def test_cut_penalty_table():
+    for max_l in (1, 14, 15, 16, 35, 36, 300):
+        table = cut_penalty_table(max_l, [15, 35], [60, 35, 2])
+        # The last entry stands for every l from there on up to max_l
+        assert len(table) <= 36
+        assert [table[min(l, len(table) - 1)] for l in range(max_l + 1)] == \
+            [cut_penalty(l, [15, 35], [60, 35, 2]) for l in range(max_l + 1)]
+    assert len(cut_penalty_table(300, [2], [1, 1])) == 2
+
+@pytest.mark.parametrize("max_l", [1, 2, 14, 15, 16, 34, 35, 36, 120])
+def test_pruned_cut_states(max_l):
+    # max_l on either side of each split, where the pruned l states end
+    frames = random_frames(600, 2, max_l)
+    weights = (5, 4, 5, [15, 35], [60, 35, 2])
+    for low_memory in (False, True):
+        check(dp_edit(frames, *weights, stride=1, max_l=max_l, low_memory=low_memory),
+              reference_dp(frames, *weights, 1, max_l))
+
+def test_max_l():
+    with pytest.raises(ValueError):
+        dp_edit(random_frames(10, 2, 0), 5, 4, 5, [15, 35], [60, 35, 2], max_l=0)
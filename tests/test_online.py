@@ -0,0 +1,70 @@
+"""
+The online stages against their offline counterparts.
+"""
+import numpy as np
+import pytest
+
+from audio_processing import (FRAME_MS, Cam, cut_penalty_table, dp_edit, frame_scores,
+                              lookahead_smoothing, path_score)
+from online import FixedLagDP, GapFiller
+
+WEIGHTS = (5, 4, 5, [15, 35], [60, 35, 2])
+
+def random_activity(n, seed):
+    """0/1 activity in runs of 1 to 12 frames"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 13, n)
+    values = (rng.integers(0, 2) + np.arange(n)) % 2
+    return np.repeat(values, lengths)[:n]
+
+def fixed_lag_path(scores, penalties, lag):
+    """Camera index of every step, committed by a FixedLagDP as the steps come in"""
+    dp = FixedLagDP(scores.shape[1], penalties, lag)
+    path = []
+    for step_scores in scores:
+        ci = dp.step(step_scores)
+        if ci is not None:
+            path.append(ci)
+    return path + dp.finish()
+
+def random_steps(n, n_speakers, seed, max_l=60):
+    frames = np.column_stack([random_activity(n, seed + k) for k in range(n_speakers)])
+    cams = Cam.all(n_speakers)
+    scores = frame_scores(frames, cams, *WEIGHTS[:3])
+    return frames, cams, scores, cut_penalty_table(max_l, *WEIGHTS[3:])
+
+@pytest.mark.parametrize("n", [1, 2, 50, 300])
+@pytest.mark.parametrize("n_speakers", [2, 3])
+def test_fixed_lag_dp_full_lag(n, n_speakers):
+    # With lag >= steps nothing is committed early, so it is dp_edit's path
+    frames, cams, scores, penalties = random_steps(n, n_speakers, n)
+    score, seq, _ = dp_edit(frames, *WEIGHTS, stride=1, max_l=60)
+    for lag in (n, n + 5):
+        path = fixed_lag_path(scores, penalties, lag)
+        assert [cams[ci] for ci in path] == seq
+        assert path_score(scores, path, penalties) == score
+
+@pytest.mark.parametrize("lag", [1, 3, 40])
+def test_fixed_lag_dp_short_lag(lag):
+    # Early commits still join up into one edit, at most as good as the optimum
+    frames, cams, scores, penalties = random_steps(400, 2, lag)
+    path = fixed_lag_path(scores, penalties, lag)
+    assert len(path) == len(scores)
+    assert path_score(scores, path, penalties) <= dp_edit(frames, *WEIGHTS, stride=1, max_l=60)[0]
+
+@pytest.mark.parametrize("frames", [0, 1, 2, 5, 12])
+def test_gap_filler(frames):
+    cases = [random_activity(n, seed) for seed in range(20) for n in (1, 2, 7, 60)]
+    cases += [np.array(a) for a in ([0, 0, 1, 1, 0, 1], [0, 0, 1, 0, 0], [1, 0, 0, 0], [])]
+    for activity in cases:
+        filler = GapFiller(frames)
+        out = []
+        for a in activity:
+            filler.push(a, out)
+        filler.finish(out)
+
+        expected = lookahead_smoothing(activity, frames * FRAME_MS / 1000)
+        # The online version never fills the gap before the first activity
+        start_gap = np.flatnonzero(activity)[0] if np.any(activity) else len(activity)
+        expected[:start_gap] = 0
+        assert out == expected.tolist()